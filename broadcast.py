@@ -0,0 +1,217 @@
+import asyncio
+import time
+from aiogram import Bot
+from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter
+from loguru import logger
+
+from database import db
+from ratelimit import TokenBucket, KeyedTokenBucket
+
+# Лимиты Bot API: около 30 сообщений в секунду всего и 1 в секунду в один чат
+GLOBAL_RATE = 25
+PER_CHAT_RATE = 1
+WORKERS = 20
+# Как часто сохранять прогресс в БД и обновлять сообщение администратору
+CHECKPOINT_INTERVAL = 5
+MAX_RETRIES = 3
+
+
+class BroadcastEngine:
+    """Фоновая рассылка с пулом воркеров, соблюдением лимитов Telegram и сохранением прогресса.
+
+    Задание и статус каждого получателя хранятся в SQLite, поэтому после
+    перезапуска рассылка продолжается с курсора, не повторяя доставленное
+    (кроме сообщений, отправленных за последние CHECKPOINT_INTERVAL секунд)
+    """
+
+    def __init__(self, global_rate=GLOBAL_RATE, per_chat_rate=PER_CHAT_RATE, workers=WORKERS):
+        self.global_limiter = TokenBucket(global_rate)
+        self.chat_limiter = KeyedTokenBucket(per_chat_rate)
+        self.workers = workers
+        self.job = None
+        self._task = None
+        self._results = []
+        self._finalizer = None
+
+    @property
+    def active(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self, bot: Bot, text: str, admin_id: int, chat_id: int, progress_message_id: int):
+        """Создание задания и запуск рассылки в фоне"""
+        if self.active:
+            raise RuntimeError("Рассылка уже выполняется")
+        job = await db.create_broadcast_job(admin_id, chat_id, progress_message_id, text)
+        self._launch(bot, job)
+        return job
+
+    async def resume(self, bot: Bot):
+        """Продолжение незавершенной рассылки после перезапуска"""
+        job = await db.get_broadcast_job(status='running')
+        if job and not self.active:
+            logger.info(
+                f"Возобновление рассылки #{job['id']} с пользователя {job['cursor']}: "
+                f"{job['sent'] + job['failed'] + job['blocked']}/{job['total']}"
+            )
+            self._launch(bot, job)
+        return job
+
+    async def stop(self):
+        """Остановка без отмены задания (при выключении бота) - оно возобновится при запуске"""
+        if self.active:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def cancel(self):
+        """Отмена текущей рассылки администратором (или зависшего задания из БД)"""
+        if self.active:
+            job = self.job
+            await self.stop()
+        else:
+            job = await db.get_broadcast_job(status='running')
+            if not job:
+                return None
+        await db.finish_broadcast_job(job['id'], 'cancelled')
+        job['status'] = 'cancelled'
+        logger.info(f"Рассылка #{job['id']} отменена")
+        return job
+
+    def _launch(self, bot: Bot, job: dict):
+        self.job = job
+        self._results = []
+        self._task = asyncio.create_task(self._run(bot, job), name="BroadcastTask")
+        self._task.add_done_callback(lambda task: self._on_done(task, job))
+
+    def _on_done(self, task: asyncio.Task, job: dict):
+        """Задание, упавшее с ошибкой, помечается failed, чтобы не висеть в статусе running"""
+        if task.cancelled() or task.exception() is None:
+            return
+        logger.opt(exception=task.exception()).error(f"Рассылка #{job['id']} прервана ошибкой")
+        job['status'] = 'failed'
+        self._finalizer = asyncio.create_task(self._mark_failed(job))
+
+    async def _mark_failed(self, job: dict):
+        try:
+            await db.finish_broadcast_job(job['id'], 'failed')
+        except Exception as e:
+            logger.error(f"Не удалось пометить рассылку #{job['id']} как failed: {e}")
+
+    async def _run(self, bot: Bot, job: dict):
+        queue = asyncio.Queue(maxsize=self.workers * 2)
+
+        async def produce():
+            async for user_id in db.iter_broadcast_recipients(job['id'], after=job['cursor']):
+                await queue.put(user_id)
+            for _ in range(self.workers):
+                await queue.put(None)
+
+        async def work():
+            while (user_id := await queue.get()) is not None:
+                status = await self._deliver(bot, user_id, job['text'])
+                job[status] += 1
+                self._results.append((status, user_id))
+
+        started = time.monotonic()
+        workers = [asyncio.create_task(work()) for _ in range(self.workers)]
+        reporter = asyncio.create_task(self._report_progress(bot, job))
+        try:
+            await produce()
+            await asyncio.gather(*workers)
+        finally:
+            for task in workers:
+                task.cancel()
+            reporter.cancel()
+            # Отчет мог быть отменен посреди сохранения: дожидаемся, пока он
+            # вернет свою пачку в self._results, и только потом сохраняем все
+            await asyncio.gather(*workers, reporter, return_exceptions=True)
+            await self._checkpoint(job)
+
+        await db.finish_broadcast_job(job['id'], 'done')
+        job['status'] = 'done'
+        elapsed = time.monotonic() - started
+        await self._edit_progress(
+            bot, job,
+            f"✅ Рассылка #{job['id']} завершена!\n\n"
+            f"✅ Успешно: {job['sent']}\n"
+            f"❌ Не удалось: {job['failed']}\n"
+            f"🚫 Заблокировали бота (удалены): {job['blocked']}"
+        )
+        await db.log_user_action(
+            job['admin_id'], 'broadcast_sent',
+            f"Успешно: {job['sent']}, Ошибок: {job['failed']}, Заблокировали: {job['blocked']}"
+        )
+        logger.success(f"Рассылка #{job['id']} завершена: {job['sent']}/{job['total']} за {elapsed:.0f} сек.")
+
+    async def _deliver(self, bot: Bot, user_id: int, text: str) -> str:
+        """Отправка одного сообщения с повтором после RetryAfter: 'sent', 'blocked' или 'failed'"""
+        for _ in range(MAX_RETRIES):
+            await self.global_limiter.acquire()
+            await self.chat_limiter.acquire(user_id)
+            try:
+                await bot.send_message(
+                    user_id,
+                    f"📢 <b>Важное сообщение от администрации:</b>\n\n{text}",
+                    parse_mode="HTML"
+                )
+                return 'sent'
+            except TelegramRetryAfter as e:
+                logger.warning(f"Рассылка: flood control, пауза {e.retry_after} сек.")
+                self.global_limiter.pause(e.retry_after)
+            except TelegramForbiddenError:
+                return 'blocked'
+            except Exception as e:
+                logger.error(f"Ошибка отправки пользователю {user_id}: {e}")
+                return 'failed'
+        return 'failed'
+
+    async def _checkpoint(self, job: dict):
+        """Сохранение накопленных статусов доставки"""
+        results, self._results = self._results, []
+        try:
+            await db.save_broadcast_progress(job, results)
+        except BaseException as e:
+            # И при отмене: потерянные статусы означали бы повторную отправку при возобновлении
+            self._results[:0] = results
+            if not isinstance(e, Exception):
+                raise
+            logger.error(f"Ошибка сохранения прогресса рассылки #{job['id']}: {e}")
+
+    async def _report_progress(self, bot: Bot, job: dict):
+        while True:
+            await asyncio.sleep(CHECKPOINT_INTERVAL)
+            await self._checkpoint(job)
+            await self._edit_progress(bot, job, format_job_progress(job))
+
+    async def _edit_progress(self, bot: Bot, job: dict, text: str):
+        if not job['chat_id'] or not job['progress_message_id']:
+            return
+        try:
+            await bot.edit_message_text(
+                text, chat_id=job['chat_id'], message_id=job['progress_message_id']
+            )
+        except Exception as e:
+            logger.warning(f"Не удалось обновить прогресс рассылки: {e}")
+
+
+def format_job_progress(job: dict) -> str:
+    """Текстовый отчет о состоянии задания рассылки"""
+    statuses = {
+        'running': '🔄 выполняется',
+        'done': '✅ завершена',
+        'cancelled': '⛔ отменена',
+        'failed': '❌ прервана ошибкой'
+    }
+    done = job['sent'] + job['failed'] + job['blocked']
+    return (
+        f"📢 Рассылка #{job['id']}: {statuses.get(job['status'], job['status'])}\n"
+        f"Обработано: {done}/{job['total']}\n\n"
+        f"✅ Успешно: {job['sent']}\n"
+        f"❌ Не удалось: {job['failed']}\n"
+        f"🚫 Заблокировали бота: {job['blocked']}"
+    )
+
+
+broadcaster = BroadcastEngine()
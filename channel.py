@@ -1,37 +1,155 @@
 import asyncio
-import feedparser
 from aiogram import Bot, Dispatcher, types, F
 from aiogram.filters import Command
 from loguru import logger
 from dotenv import load_dotenv, find_dotenv
 import os
 
+from rss import feed_poller, FeedPoller
+from dedupe import news_dedupe, news_fingerprints, canonicalize_url
+from publisher import publisher, Publisher
+
 load_dotenv(find_dotenv())
 CHANNEL_ID = os.getenv("CHANNEL_ID")
+# Каналы для публикации новостей через запятую; по умолчанию - CHANNEL_ID
+NEWS_CHANNEL_IDS = [
+    chat_id.strip() for chat_id in os.getenv("NEWS_CHANNEL_IDS", CHANNEL_ID or "").split(",") if chat_id.strip()
+]
+# Размер очередей между стадиями конвейера
+PIPELINE_QUEUE_SIZE = 50
 
-async def send_news_task(bot: Bot):
-    last_entries = set()
-    
-    while True:
+_STAGE_DONE = object()
+
+
+class NewsPipeline:
+    """Конвейер новостей: загрузка -> разбор -> дедупликация -> форматирование -> публикация.
+
+    Стадии - цепочка асинхронных генераторов, между ними ограниченные очереди:
+    медленная публикация заполняет очереди и останавливает опрос лент
+    """
+
+    def __init__(self, poller: FeedPoller, publisher: Publisher, destinations: list,
+                 queue_size: int = PIPELINE_QUEUE_SIZE):
+        self.poller = poller
+        self.publisher = publisher
+        self.destinations = destinations
+        self.queue_size = queue_size
+        self._feeds = asyncio.Queue(maxsize=queue_size)
+        self.published = 0
+
+    async def _on_feed(self, feed, entries):
+        """Обработчик FeedPoller: ждет дедупликацию, чтобы вернуть число новых записей"""
+        done = asyncio.get_running_loop().create_future()
+        await self._feeds.put((feed, entries, done))
+        return await done
+
+    async def _parsed(self):
+        """Источник: разобранные ленты от FeedPoller (загрузка и разбор идут в нем)"""
+        while True:
+            yield await self._feeds.get()
+
+    async def _dedupe(self, batches):
+        async for feed, entries, done in batches:
+            try:
+                # Записи без ссылки не с чем сверять и нечем открыть - пропускаются
+                by_link = {canonicalize_url(entry['link']): entry for entry in entries if entry.get('link')}
+                new_entries = []
+                for link in await news_dedupe.claim(list(by_link)):
+                    entry = by_link[link]
+                    if await news_fingerprints.claim(f"{entry.get('title', '')} {entry.get('description', '')}"):
+                        new_entries.append(entry)
+                    else:
+                        logger.info(f"Пропущен почти-дубликат: {entry.get('title', link)}")
+            except Exception as e:
+                if not done.done():
+                    done.set_exception(e)
+                continue
+            if not done.done():
+                done.set_result(len(new_entries))
+            if new_entries:
+                logger.info(f"Найдено {len(new_entries)} новых новостей в {feed['url']}")
+                # В ленте свежие записи идут первыми, публикуем в хронологическом порядке
+                yield list(reversed(new_entries))
+
+    async def _format(self, batches):
+        async for entries in batches:
+            posts = []
+            for entry in entries:
+                try:
+                    posts.append({'title': entry.get('title', ''), 'link': entry.get('link'), 'text': format_news(entry)})
+                except Exception as e:
+                    logger.error(f"Ошибка форматирования новости {entry.get('link')}: {e}")
+            if posts:
+                yield posts
+
+    async def _publish(self, bot: Bot, batches):
+        async for posts in batches:
+            # Каналы публикуются параллельно, лимиты у каждого свои;
+            # ошибка одного канала не останавливает остальные и конвейер
+            results = await asyncio.gather(*(
+                self.publisher.publish(bot, chat_id, posts) for chat_id in self.destinations
+            ), return_exceptions=True)
+            for chat_id, result in zip(self.destinations, results):
+                if isinstance(result, Exception):
+                    logger.error(f"Ошибка публикации в {chat_id}: {result}")
+            self.published += len(posts)
+
+    async def _buffered(self, stage):
+        """Запуск стадии в отдельной задаче с ограниченной очередью до следующей стадии"""
+        queue = asyncio.Queue(maxsize=self.queue_size)
+
+        async def pump():
+            try:
+                async for item in stage:
+                    await queue.put(item)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                await queue.put(e)
+            else:
+                await queue.put(_STAGE_DONE)
+
+        task = asyncio.create_task(pump())
+        try:
+            while (item := await queue.get()) is not _STAGE_DONE:
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            task.cancel()
+
+    @property
+    def pending(self) -> int:
+        """Лент, ожидающих дедупликации"""
+        return self._feeds.qsize()
+
+    async def run(self, bot: Bot):
+        """Запуск конвейера до отмены задачи"""
+        if not self.destinations:
+            logger.warning("Не заданы каналы для новостей (NEWS_CHANNEL_IDS/CHANNEL_ID), RSS отключен")
+            return
+        await news_dedupe.import_legacy()
+        await news_fingerprints.load()
+        tasks = [
+            asyncio.create_task(self.poller.run(self._on_feed), name="FeedPollerTask"),
+            asyncio.create_task(self.publisher.retry_loop(bot), name="PostRetryTask"),
+        ]
         try:
-            feed = feedparser.parse("https://www.sports.ru/rss/all_news.xml")
-            
-            new_entries = []
-            for entry in feed.entries:
-                if entry.link not in last_entries:
-                    new_entries.append(entry)
-                    last_entries.add(entry.link)
-            
-            for entry in reversed(new_entries):
-                message = f"📰 {entry.title}\n\n{entry.description}\n\n🔗 Читать далее: {entry.link}"
-                await bot.send_message(CHANNEL_ID, message)
-                logger.success(f"Новость отправлена: {entry.title}")
-                await asyncio.sleep(2) 
-                
-        except Exception as e:
-            logger.error(f"Канал: ошибка {e}")
-
-        await asyncio.sleep(300) 
+            entries = self._buffered(self._dedupe(self._parsed()))
+            posts = self._buffered(self._format(entries))
+            await self._publish(bot, posts)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def format_news(entry) -> str:
+    """Текст поста в канал"""
+    return f"<b>{entry.get('title', '')}</b>\n\n{entry.get('description', '')}\n\n<a href='{entry.get('link')}'>Читать далее</a>"
+
+
+news_pipeline = NewsPipeline(feed_poller, publisher, NEWS_CHANNEL_IDS)
 
 def setup_channel_handlers(dp: Dispatcher, bot: Bot):  # ← Только 2 аргумента!
     
@@ -1,115 +1,655 @@
 import aiosqlite
 import asyncio
-from datetime import datetime
+import os
+import time
+from collections import Counter, OrderedDict
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
 from loguru import logger
 
+# Атомарный upsert: счетчик увеличивается внутри SQLite, без чтения в Python
+UPSERT_USER_SQL = '''
+    INSERT INTO user_stats
+    (user_id, username, first_name, last_name, messages_count, last_seen)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT(user_id) DO UPDATE SET
+        username = excluded.username,
+        first_name = excluded.first_name,
+        last_name = excluded.last_name,
+        messages_count = messages_count + excluded.messages_count,
+        last_seen = excluded.last_seen
+'''
+
+# WAL позволяет читателям не блокировать писателя; synchronous=NORMAL
+# в режиме WAL не нарушает целостность и не делает fsync на каждый commit
+CONNECTION_PRAGMAS = [
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA busy_timeout=5000',
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA cache_size=-16384',
+    'PRAGMA mmap_size=134217728',
+]
+
+# Миграции схемы: (версия, список SQL). Применяются только вперед,
+# выпущенные миграции не редактируются - изменения добавляются новой версией
+MIGRATIONS = [
+    (1, [
+        '''
+        CREATE TABLE IF NOT EXISTS user_stats (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            first_name TEXT,
+            last_name TEXT,
+            messages_count INTEGER DEFAULT 0,
+            warnings_count INTEGER DEFAULT 0,
+            first_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS feedback (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            message TEXT,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES user_stats (user_id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS user_actions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            action_type TEXT,
+            details TEXT,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES user_stats (user_id)
+        )
+        ''',
+    ]),
+    (2, [
+        'CREATE INDEX IF NOT EXISTS idx_user_actions_user_time ON user_actions (user_id, timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_user_actions_type_time ON user_actions (action_type, timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_user_actions_time ON user_actions (timestamp)',
+        '''
+        CREATE TABLE IF NOT EXISTS user_actions_daily (
+            day TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            action_type TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, user_id, action_type)
+        ) WITHOUT ROWID
+        ''',
+    ]),
+    (3, [
+        '''
+        CREATE TABLE IF NOT EXISTS stats_counters (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+        ''',
+        '''
+        INSERT OR REPLACE INTO stats_counters (name, value) VALUES
+            ('total_users', (SELECT COUNT(*) FROM user_stats)),
+            ('total_messages', (SELECT COALESCE(SUM(messages_count), 0) FROM user_stats)),
+            ('total_feedback', (SELECT COUNT(*) FROM feedback))
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_user_stats_insert AFTER INSERT ON user_stats
+        BEGIN
+            UPDATE stats_counters SET value = value + 1 WHERE name = 'total_users';
+            UPDATE stats_counters SET value = value + NEW.messages_count WHERE name = 'total_messages';
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_user_stats_delete AFTER DELETE ON user_stats
+        BEGIN
+            UPDATE stats_counters SET value = value - 1 WHERE name = 'total_users';
+            UPDATE stats_counters SET value = value - OLD.messages_count WHERE name = 'total_messages';
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_user_stats_messages AFTER UPDATE OF messages_count ON user_stats
+        BEGIN
+            UPDATE stats_counters SET value = value + NEW.messages_count - OLD.messages_count
+            WHERE name = 'total_messages';
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_feedback_insert AFTER INSERT ON feedback
+        BEGIN
+            UPDATE stats_counters SET value = value + 1 WHERE name = 'total_feedback';
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_feedback_delete AFTER DELETE ON feedback
+        BEGIN
+            UPDATE stats_counters SET value = value - 1 WHERE name = 'total_feedback';
+        END
+        ''',
+    ]),
+    (4, [
+        'CREATE INDEX IF NOT EXISTS idx_user_stats_last_seen ON user_stats (last_seen, user_id)',
+    ]),
+    (5, [
+        '''
+        CREATE TABLE IF NOT EXISTS broadcast_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            admin_id INTEGER,
+            chat_id INTEGER,
+            progress_message_id INTEGER,
+            text TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'running',
+            cursor INTEGER NOT NULL DEFAULT 0,
+            total INTEGER NOT NULL DEFAULT 0,
+            sent INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            blocked INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS broadcast_recipients (
+            job_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            PRIMARY KEY (job_id, user_id),
+            FOREIGN KEY (job_id) REFERENCES broadcast_jobs (id)
+        ) WITHOUT ROWID
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_broadcast_jobs_status ON broadcast_jobs (status)',
+    ]),
+    (6, [
+        '''
+        CREATE TABLE IF NOT EXISTS feeds (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            url TEXT NOT NULL UNIQUE,
+            etag TEXT,
+            last_modified TEXT,
+            checked_at TIMESTAMP
+        )
+        ''',
+    ]),
+    (7, [
+        'ALTER TABLE feeds ADD COLUMN enabled INTEGER NOT NULL DEFAULT 1',
+        'ALTER TABLE feeds ADD COLUMN poll_interval REAL NOT NULL DEFAULT 300',
+        'ALTER TABLE feeds ADD COLUMN error_count INTEGER NOT NULL DEFAULT 0',
+        'ALTER TABLE feeds ADD COLUMN last_error TEXT',
+        "INSERT OR IGNORE INTO feeds (url) VALUES ('https://www.sports.ru/rss/all_news.xml')",
+    ]),
+    (8, [
+        '''
+        CREATE TABLE IF NOT EXISTS seen_entries (
+            key TEXT PRIMARY KEY,
+            seen_at REAL NOT NULL
+        ) WITHOUT ROWID
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_seen_entries_seen_at ON seen_entries (seen_at)',
+    ]),
+    (9, [
+        '''
+        CREATE TABLE IF NOT EXISTS news_fingerprints (
+            simhash INTEGER PRIMARY KEY,
+            seen_at REAL NOT NULL
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_news_fingerprints_seen_at ON news_fingerprints (seen_at)',
+    ]),
+    (10, [
+        '''
+        CREATE TABLE IF NOT EXISTS post_queue (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id TEXT NOT NULL,
+            text TEXT NOT NULL,
+            attempts INTEGER DEFAULT 0,
+            next_attempt_at REAL NOT NULL,
+            last_error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_post_queue_next_attempt ON post_queue (next_attempt_at)',
+    ]),
+    (11, [
+        '''
+        CREATE TABLE IF NOT EXISTS chat_bad_words (
+            chat_id INTEGER NOT NULL,
+            word TEXT NOT NULL,
+            added_by INTEGER,
+            added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (chat_id, word)
+        ) WITHOUT ROWID
+        ''',
+    ]),
+    (12, [
+        '''
+        CREATE TABLE IF NOT EXISTS user_warnings (
+            chat_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            warned_at REAL NOT NULL
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_user_warnings_warned_at ON user_warnings (warned_at)',
+    ]),
+    (13, [
+        '''
+        CREATE TABLE IF NOT EXISTS kv_state (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL,
+            expires_at REAL
+        ) WITHOUT ROWID
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_kv_state_expires_at ON kv_state (expires_at)',
+    ]),
+    (14, [
+        # Номер версии списка слов чата: другие процессы по нему видят изменения
+        '''
+        CREATE TABLE IF NOT EXISTS chat_word_versions (
+            chat_id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL
+        )
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_chat_bad_words_insert AFTER INSERT ON chat_bad_words
+        BEGIN
+            INSERT INTO chat_word_versions (chat_id, version) VALUES (NEW.chat_id, 1)
+            ON CONFLICT(chat_id) DO UPDATE SET version = version + 1;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_chat_bad_words_delete AFTER DELETE ON chat_bad_words
+        BEGIN
+            INSERT INTO chat_word_versions (chat_id, version) VALUES (OLD.chat_id, 1)
+            ON CONFLICT(chat_id) DO UPDATE SET version = version + 1;
+        END
+        ''',
+    ]),
+]
+
+FEED_COLUMNS = ('id', 'url', 'enabled', 'poll_interval', 'error_count', 'last_error', 'checked_at')
+
+BROADCAST_JOB_COLUMNS = (
+    'id', 'admin_id', 'chat_id', 'progress_message_id', 'text', 'status', 'cursor',
+    'total', 'sent', 'failed', 'blocked', 'created_at', 'finished_at'
+)
+
+USER_STATS_COLUMNS = (
+    'user_id', 'username', 'first_name', 'last_name', 'messages_count',
+    'warnings_count', 'first_seen', 'last_seen'
+)
+
+USER_LIST_COLUMNS = 'user_id, username, first_name, last_name, messages_count, first_seen, last_seen'
+
+
+def _utc_timestamp():
+    """Текущее время в формате CURRENT_TIMESTAMP SQLite"""
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+class UserRowCache:
+    """LRU-кэш строк user_stats с ограниченным временем жизни записи и счетчиками попаданий"""
+
+    def __init__(self, max_size=10000, ttl=60.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._rows = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        # user_id -> число записей; читатель не кладет строку, если пользователь
+        # изменился за время чтения. Счетчики живут, пока идут чтения
+        self._versions = {}
+        self._readers = 0
+
+    def __len__(self):
+        return len(self._rows)
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def get(self, user_id: int):
+        entry = self._rows.get(user_id)
+        if entry is None or entry[1] <= time.monotonic():
+            if entry is not None:
+                del self._rows[user_id]
+            self.misses += 1
+            return None
+        self._rows.move_to_end(user_id)
+        self.hits += 1
+        return tuple(entry[0])
+
+    def put(self, row):
+        if not self.max_size:
+            return
+        self._rows[row[0]] = (list(row), time.monotonic() + self.ttl)
+        self._rows.move_to_end(row[0])
+        while len(self._rows) > self.max_size:
+            self._rows.popitem(last=False)
+
+    def update(self, user_id: int, **changes):
+        """Применение записи к закэшированной строке (если она есть)"""
+        self._bump(user_id)
+        entry = self._rows.get(user_id)
+        if entry is None:
+            return
+        row = entry[0]
+        for column, value in changes.items():
+            index = USER_STATS_COLUMNS.index(column)
+            row[index] = value(row[index]) if callable(value) else value
+
+    def discard(self, user_id: int):
+        self._bump(user_id)
+        self._rows.pop(user_id, None)
+
+    def _bump(self, user_id: int):
+        if self._readers:
+            self._versions[user_id] = self._versions.get(user_id, 0) + 1
+
+    def begin_read(self, user_id: int):
+        """Начало чтения строки из БД; возвращает метку для put_if_unchanged"""
+        self._readers += 1
+        return self._versions.get(user_id, 0)
+
+    def put_if_unchanged(self, row, user_id: int, version):
+        """Конец чтения: строка кладется, только если пользователь не менялся"""
+        self._readers -= 1
+        changed = self._versions.get(user_id, 0) != version
+        if not self._readers:
+            self._versions.clear()
+        if row is not None and not changed:
+            self.put(row)
+
+
 class Database:
-    def __init__(self, db_path='bot.db'):
+    def __init__(self, db_path='bot.db', readers=4, flush_interval=0.5, max_batch=500,
+                 stats_ttl=5.0, user_cache_size=10000, user_cache_ttl=60.0):
         self.db_path = db_path
+        self.readers = readers
+        # flush_interval - максимальное время (сек.), которое активность
+        # пользователей живет только в памяти; 0 - запись без буфера
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._writer = None
+        self._write_lock = asyncio.Lock()
+        self._read_pool = None
+        self._pending_users = {}
+        self._pending_actions = []
+        self._pending_warnings = []
+        self._flush_event = asyncio.Event()
+        self._flush_task = None
+        # Держится от изъятия буфера до commit: flush() читателя дождется уже идущей записи
+        self._flush_lock = asyncio.Lock()
+        # Общая статистика кэшируется на stats_ttl секунд
+        self.stats_ttl = stats_ttl
+        self._total_stats_cache = None
+        # Строки пользователей; записи через этот объект обновляют кэш сразу
+        self.user_cache = UserRowCache(user_cache_size, user_cache_ttl)
+
+    async def _connect(self):
+        """Новое соединение с настроенными PRAGMA"""
+        conn = await aiosqlite.connect(self.db_path)
+        for pragma in CONNECTION_PRAGMAS:
+            await conn.execute_fetchall(pragma)
+        return conn
+
+    async def open(self):
+        """Открытие пула соединений: один писатель и несколько читателей"""
+        if self._writer is not None:
+            return
+        self._writer = await self._connect()
+        self._read_pool = asyncio.Queue()
+        for _ in range(self.readers):
+            self._read_pool.put_nowait(await self._connect())
+        if self.flush_interval:
+            self._flush_task = asyncio.create_task(self._flush_loop(), name="DBFlushTask")
+        logger.info(f"Пул соединений открыт: 1 писатель, {self.readers} читателей")
+
+    async def close(self):
+        """Сброс буфера и закрытие всех соединений пула"""
+        if self._writer is None:
+            return
+        if self._flush_task:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        await self.flush()
+        async with self._write_lock:
+            await self._writer.close()
+            self._writer = None
+        while not self._read_pool.empty():
+            await self._read_pool.get_nowait().close()
+        self._read_pool = None
+        logger.info("Пул соединений закрыт")
+
+    @asynccontextmanager
+    async def writer(self):
+        """Эксклюзивный доступ к соединению-писателю"""
+        async with self._write_lock:
+            yield self._writer
+
+    @asynccontextmanager
+    async def reader(self):
+        """Соединение-читатель из пула"""
+        conn = await self._read_pool.get()
+        try:
+            yield conn
+        finally:
+            self._read_pool.put_nowait(conn)
+
+    def _pending_rows(self):
+        return len(self._pending_users) + len(self._pending_actions) + len(self._pending_warnings)
+
+    def _schedule_flush(self):
+        if self._pending_rows() >= self.max_batch:
+            self._flush_event.set()
+
+    async def _flush_loop(self):
+        """Фоновый сброс буфера каждые flush_interval секунд или по заполнении"""
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_event.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_event.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Ошибка сброса буфера активности: {e}")
+
+    async def flush(self):
+        """Запись накопленной активности пользователей одной транзакцией"""
+        async with self._flush_lock:
+            if not self._pending_rows():
+                return
+            users, self._pending_users = self._pending_users, {}
+            actions, self._pending_actions = self._pending_actions, []
+            warnings, self._pending_warnings = self._pending_warnings, []
+            try:
+                async with self.writer() as db:
+                    if users:
+                        await db.executemany(UPSERT_USER_SQL, [
+                            (user_id, p['username'], p['first_name'], p['last_name'],
+                             p['count'], p['last_seen'])
+                            for user_id, p in users.items()
+                        ])
+                    if actions:
+                        await db.executemany('''
+                            INSERT INTO user_actions (user_id, action_type, details, timestamp)
+                            VALUES (?, ?, ?, ?)
+                        ''', actions)
+                    if warnings:
+                        await self._write_warnings(db, warnings)
+                    await db.commit()
+            except BaseException:
+                # В том числе при отмене: иначе изъятая пачка теряется
+                self._requeue(users, actions, warnings)
+                raise
+
+    def _has_pending(self, user_id: int) -> bool:
+        return user_id in self._pending_users or any(
+            warning[1] == user_id for warning in self._pending_warnings
+        )
+
+    def _requeue(self, users, actions, warnings):
+        """Возврат неудачно записанной пачки в буфер"""
+        for user_id, p in users.items():
+            pending = self._pending_users.get(user_id)
+            if pending:
+                pending['count'] += p['count']
+            else:
+                self._pending_users[user_id] = p
+        self._pending_actions[:0] = actions
+        self._pending_warnings[:0] = warnings
 
     async def init_db(self):
-        """Инициализация базы данных и создание таблиц"""
-        async with aiosqlite.connect(self.db_path) as db:
-            
-            await db.execute('DROP TABLE IF EXISTS user_stats')
-            await db.execute('DROP TABLE IF EXISTS feedback')
-            await db.execute('DROP TABLE IF EXISTS user_actions')
-            
-            
+        """Инициализация базы данных и применение миграций схемы"""
+        await self.open()
+        async with self.writer() as db:
             await db.execute('''
-                CREATE TABLE IF NOT EXISTS user_stats (
-                    user_id INTEGER PRIMARY KEY,
-                    username TEXT,
-                    first_name TEXT,
-                    last_name TEXT,
-                    messages_count INTEGER DEFAULT 0,
-                    warnings_count INTEGER DEFAULT 0,
-                    first_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    last_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    version INTEGER PRIMARY KEY,
+                    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 )
             ''')
+            await db.commit()
             
+            async with db.execute('SELECT MAX(version) FROM schema_version') as cursor:
+                current_version = (await cursor.fetchone())[0] or 0
             
-            await db.execute('''
-                CREATE TABLE IF NOT EXISTS feedback (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER,
-                    message TEXT,
-                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES user_stats (user_id)
-                )
-            ''')
+            for version, statements in MIGRATIONS:
+                if version <= current_version:
+                    continue
+                try:
+                    await db.execute('BEGIN')
+                    for statement in statements:
+                        await db.execute(statement)
+                    await db.execute('INSERT INTO schema_version (version) VALUES (?)', (version,))
+                    await db.commit()
+                except Exception:
+                    await db.rollback()
+                    raise
+                current_version = version
+                logger.info(f"Применена миграция схемы №{version}")
             
+            async with db.execute('PRAGMA auto_vacuum') as cursor:
+                auto_vacuum = (await cursor.fetchone())[0]
+            if auto_vacuum != 2:
+                # auto_vacuum меняется только через полный VACUUM - один раз
+                await db.execute('PRAGMA auto_vacuum=INCREMENTAL')
+                await db.execute('VACUUM')
+                logger.info("Включен режим incremental auto_vacuum")
+        logger.info(f"База данных инициализирована, версия схемы: {current_version}")
+
+    async def compact_user_actions(self, retention_days: int):
+        """Свертка сырых действий старше retention_days в дневные агрегаты"""
+        cutoff_day = (datetime.now(timezone.utc) - timedelta(days=retention_days)).strftime('%Y-%m-%d')
+        compacted = 0
+        while True:
+            async with self.reader() as db:
+                async with db.execute('SELECT MIN(timestamp) FROM user_actions') as cursor:
+                    oldest = (await cursor.fetchone())[0]
+            if oldest is None or oldest[:10] >= cutoff_day:
+                break
             
-            await db.execute('''
-                CREATE TABLE IF NOT EXISTS user_actions (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER,
-                    action_type TEXT,
-                    details TEXT,
-                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES user_stats (user_id)
-                )
-            ''')
-            
+            # По одному дню за транзакцию, чтобы не держать писателя надолго
+            day = oldest[:10]
+            next_day = (datetime.strptime(day, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+            async with self.writer() as db:
+                await db.execute('''
+                    INSERT INTO user_actions_daily (day, user_id, action_type, count)
+                    SELECT date(timestamp), user_id, action_type, COUNT(*)
+                    FROM user_actions
+                    WHERE timestamp < ?
+                    GROUP BY date(timestamp), user_id, action_type
+                    ON CONFLICT (day, user_id, action_type) DO UPDATE SET
+                        count = count + excluded.count
+                ''', (next_day,))
+                cursor = await db.execute('DELETE FROM user_actions WHERE timestamp < ?', (next_day,))
+                compacted += cursor.rowcount
+                await cursor.close()
+                await db.commit()
+        if compacted:
+            logger.info(f"Свернуто {compacted} старых действий пользователей")
+        return compacted
+
+    async def incremental_vacuum(self, pages: int = 2000):
+        """Возврат свободных страниц файлу БД небольшими порциями"""
+        async with self.writer() as db:
+            await db.execute_fetchall(f'PRAGMA incremental_vacuum({int(pages)})')
             await db.commit()
-        logger.info("База данных инициализирована")
+
+    async def run_maintenance(self, retention_days: int):
+        """Плановое обслуживание: свертка действий, vacuum и обновление статистики планировщика"""
+        await self.compact_user_actions(retention_days)
+        await self.purge_broadcast_recipients(retention_days)
+        await self.purge_user_warnings(retention_days)
+        await self.incremental_vacuum()
+        async with self.writer() as db:
+            await db.execute_fetchall('PRAGMA optimize')
+
+    async def backup(self, target_path: str):
+        """Консистентная резервная копия через SQLite backup API (с учетом WAL)"""
+        await self.flush()
+        async with self.reader() as db:
+            async with aiosqlite.connect(target_path) as target:
+                await db.backup(target)
 
     async def add_or_update_user(self, user: dict):
         """Добавление или обновление пользователя"""
-        async with aiosqlite.connect(self.db_path) as db:
-            
-            cursor = await db.execute(
-                'SELECT messages_count FROM user_stats WHERE user_id = ?',
-                (user['id'],)
+        await self.add_or_update_users([user])
+
+    async def add_or_update_users(self, users: list):
+        """Добавление или обновление пачки пользователей (по одному сообщению на запись)"""
+        now = datetime.now()
+        for user in users:
+            self.user_cache.update(
+                user['id'],
+                username=user.get('username'),
+                first_name=user.get('first_name'),
+                last_name=user.get('last_name'),
+                messages_count=lambda count: count + 1,
+                last_seen=str(now)
             )
-            existing_user = await cursor.fetchone()
-            
-            if existing_user:
-                
-                current_count = existing_user[0]
-                await db.execute('''
-                    UPDATE user_stats 
-                    SET username = ?, first_name = ?, last_name = ?, 
-                        messages_count = ?, last_seen = ?
-                    WHERE user_id = ?
-                ''', (
-                    user.get('username'),
-                    user.get('first_name'),
-                    user.get('last_name'),
-                    current_count + 1,
-                    datetime.now(),
-                    user['id']
-                ))
-            else:
-                
-                await db.execute('''
-                    INSERT INTO user_stats 
-                    (user_id, username, first_name, last_name, messages_count, last_seen)
-                    VALUES (?, ?, ?, ?, 1, ?)
-                ''', (
-                    user['id'],
-                    user.get('username'),
-                    user.get('first_name'),
-                    user.get('last_name'),
-                    datetime.now()
-                ))
-            
+        if self.flush_interval:
+            for user in users:
+                pending = self._pending_users.get(user['id'])
+                self._pending_users[user['id']] = {
+                    'username': user.get('username'),
+                    'first_name': user.get('first_name'),
+                    'last_name': user.get('last_name'),
+                    'count': pending['count'] + 1 if pending else 1,
+                    'last_seen': now
+                }
+            self._schedule_flush()
+            return
+
+        async with self.writer() as db:
+            await db.executemany(UPSERT_USER_SQL, [
+                (user['id'], user.get('username'), user.get('first_name'),
+                 user.get('last_name'), 1, now)
+                for user in users
+            ])
             await db.commit()
 
     async def increment_messages_count(self, user_id: int):
         """Увеличение счетчика сообщений пользователя"""
-        async with aiosqlite.connect(self.db_path) as db:
+        now = datetime.now()
+        self.user_cache.update(user_id, messages_count=lambda count: count + 1, last_seen=str(now))
+        async with self.writer() as db:
             await db.execute('''
                 UPDATE user_stats 
                 SET messages_count = messages_count + 1, last_seen = ?
                 WHERE user_id = ?
-            ''', (datetime.now(), user_id))
+            ''', (now, user_id))
             await db.commit()
 
     async def add_feedback(self, user_id: int, message: str):
         """Добавление обратной связи"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self.writer() as db:
             await db.execute('''
                 INSERT INTO feedback (user_id, message) 
                 VALUES (?, ?)
@@ -118,7 +658,12 @@ class Database:
 
     async def log_user_action(self, user_id: int, action_type: str, details: str = None):
         """Логирование действий пользователя"""
-        async with aiosqlite.connect(self.db_path) as db:
+        if self.flush_interval:
+            self._pending_actions.append((user_id, action_type, details, _utc_timestamp()))
+            self._schedule_flush()
+            return
+
+        async with self.writer() as db:
             await db.execute('''
                 INSERT INTO user_actions (user_id, action_type, details) 
                 VALUES (?, ?, ?)
@@ -126,42 +671,560 @@ class Database:
             await db.commit()
 
     async def get_user_stats(self, user_id: int):
-        """Получение статистики пользователя"""
-        async with aiosqlite.connect(self.db_path) as db:
-            cursor = await db.execute('''
-                SELECT * FROM user_stats WHERE user_id = ?
-            ''', (user_id,))
-            user_data = await cursor.fetchone()
+        """Получение статистики пользователя (из кэша, если строка свежая)"""
+        user_data = self.user_cache.get(user_id)
+        if user_data is not None:
             return user_data
+        version = self.user_cache.begin_read(user_id)
+        user_data = None
+        try:
+            # Сброс нужен, только если строка этого пользователя ждет записи
+            # (в буфере или в уже идущем flush)
+            if self._flush_lock.locked() or self._has_pending(user_id):
+                await self.flush()
+            async with self.reader() as db:
+                async with db.execute(f'''
+                    SELECT {', '.join(USER_STATS_COLUMNS)} FROM user_stats WHERE user_id = ?
+                ''', (user_id,)) as cursor:
+                    user_data = await cursor.fetchone()
+        finally:
+            # Запись этого пользователя во время чтения могла не попасть в строку
+            self.user_cache.put_if_unchanged(user_data, user_id, version)
+        return user_data
+
+    async def get_users_page(self, after=None, before=None, limit=10):
+        """Страница пользователей по last_seen (новые первыми) с курсором (last_seen, user_id)"""
+        await self.flush()
+        if before:
+            query = f'''
+                SELECT {USER_LIST_COLUMNS} FROM user_stats
+                WHERE (last_seen, user_id) > (?, ?)
+                ORDER BY last_seen ASC, user_id ASC
+                LIMIT ?
+            '''
+            params = (*before, limit)
+        elif after:
+            query = f'''
+                SELECT {USER_LIST_COLUMNS} FROM user_stats
+                WHERE (last_seen, user_id) < (?, ?)
+                ORDER BY last_seen DESC, user_id DESC
+                LIMIT ?
+            '''
+            params = (*after, limit)
+        else:
+            query = f'''
+                SELECT {USER_LIST_COLUMNS} FROM user_stats
+                ORDER BY last_seen DESC, user_id DESC
+                LIMIT ?
+            '''
+            params = (limit,)
+        
+        async with self.reader() as db:
+            users = await db.execute_fetchall(query, params)
+        users = list(users)
+        if before:
+            users.reverse()
+        return users
 
-    async def get_all_users(self):
-        """Получение списка всех пользователей"""
-        async with aiosqlite.connect(self.db_path) as db:
+    async def iter_users(self, after: int = None, limit: int = None, batch_size: int = 500):
+        """Асинхронный обход пользователей по возрастанию user_id страницами по batch_size"""
+        await self.flush()
+        remaining = limit
+        cursor_id = after if after is not None else -1
+        while remaining is None or remaining > 0:
+            size = batch_size if remaining is None else min(batch_size, remaining)
+            async with self.reader() as db:
+                users = await db.execute_fetchall(f'''
+                    SELECT {USER_LIST_COLUMNS} FROM user_stats
+                    WHERE user_id > ?
+                    ORDER BY user_id
+                    LIMIT ?
+                ''', (cursor_id, size))
+            if not users:
+                break
+            for user in users:
+                yield user
+            cursor_id = users[-1][0]
+            if remaining is not None:
+                remaining -= len(users)
+            if len(users) < size:
+                break
+
+    async def remove_users(self, user_ids: list):
+        """Удаление пользователей (например, заблокировавших бота)"""
+        if not user_ids:
+            return
+        for user_id in user_ids:
+            self._pending_users.pop(user_id, None)
+            self.user_cache.discard(user_id)
+        async with self.writer() as db:
+            await db.executemany(
+                'DELETE FROM user_stats WHERE user_id = ?',
+                [(user_id,) for user_id in user_ids]
+            )
+            await db.commit()
+
+    async def create_broadcast_job(self, admin_id: int, chat_id: int,
+                                   progress_message_id: int, text: str):
+        """Создание задания рассылки со снимком получателей на момент запуска"""
+        await self.flush()
+        async with self.writer() as db:
             cursor = await db.execute('''
-                SELECT user_id, username, first_name, last_name, messages_count, first_seen, last_seen
-                FROM user_stats 
-                ORDER BY last_seen DESC
-            ''')
-            users = await cursor.fetchall()
-            return users
+                INSERT INTO broadcast_jobs (admin_id, chat_id, progress_message_id, text)
+                VALUES (?, ?, ?, ?)
+            ''', (admin_id, chat_id, progress_message_id, text))
+            job_id = cursor.lastrowid
+            await cursor.close()
+            cursor = await db.execute('''
+                INSERT INTO broadcast_recipients (job_id, user_id)
+                SELECT ?, user_id FROM user_stats
+            ''', (job_id,))
+            total = cursor.rowcount
+            await cursor.close()
+            await db.execute('UPDATE broadcast_jobs SET total = ? WHERE id = ?', (total, job_id))
+            await db.commit()
+        return await self.get_broadcast_job(job_id)
+
+    async def get_broadcast_job(self, job_id: int = None, status: str = None):
+        """Задание рассылки по id, либо последнее (с указанным статусом)"""
+        query = f"SELECT {', '.join(BROADCAST_JOB_COLUMNS)} FROM broadcast_jobs"
+        if job_id is not None:
+            query += ' WHERE id = ?'
+            params = (job_id,)
+        elif status is not None:
+            query += ' WHERE status = ? ORDER BY id DESC LIMIT 1'
+            params = (status,)
+        else:
+            query += ' ORDER BY id DESC LIMIT 1'
+            params = ()
+        async with self.reader() as db:
+            rows = await db.execute_fetchall(query, params)
+        return dict(zip(BROADCAST_JOB_COLUMNS, rows[0])) if rows else None
+
+    async def iter_broadcast_recipients(self, job_id: int, after: int = 0, batch_size: int = 500):
+        """Необработанные получатели задания по возрастанию user_id, начиная после курсора"""
+        while True:
+            async with self.reader() as db:
+                rows = await db.execute_fetchall('''
+                    SELECT user_id FROM broadcast_recipients
+                    WHERE job_id = ? AND user_id > ? AND status = 'pending'
+                    ORDER BY user_id
+                    LIMIT ?
+                ''', (job_id, after, batch_size))
+            for (user_id,) in rows:
+                yield user_id
+            if len(rows) < batch_size:
+                break
+            after = rows[-1][0]
+
+    async def save_broadcast_progress(self, job: dict, results: list):
+        """Запись статусов доставки и продвижение курсора задания.
+
+        results - список (status, user_id); курсор - наибольший user_id, до которого
+        включительно все получатели обработаны
+        """
+        async with self.writer() as db:
+            if results:
+                await db.executemany(
+                    'UPDATE broadcast_recipients SET status = ? WHERE job_id = ? AND user_id = ?',
+                    [(status, job['id'], user_id) for status, user_id in results]
+                )
+            await db.execute('''
+                UPDATE broadcast_jobs
+                SET sent = ?, failed = ?, blocked = ?,
+                    cursor = COALESCE(
+                        (SELECT MIN(user_id) - 1 FROM broadcast_recipients
+                         WHERE job_id = ? AND status = 'pending'),
+                        (SELECT MAX(user_id) FROM broadcast_recipients WHERE job_id = ?),
+                        cursor
+                    )
+                WHERE id = ?
+            ''', (job['sent'], job['failed'], job['blocked'], job['id'], job['id'], job['id']))
+            await db.commit()
+
+    async def finish_broadcast_job(self, job_id: int, status: str):
+        """Завершение задания; заблокировавшие бота пользователи удаляются"""
+        async with self.writer() as db:
+            await db.execute(
+                'UPDATE broadcast_jobs SET status = ?, finished_at = CURRENT_TIMESTAMP WHERE id = ?',
+                (status, job_id)
+            )
+            await db.commit()
+        async with self.reader() as db:
+            blocked = await db.execute_fetchall(
+                "SELECT user_id FROM broadcast_recipients WHERE job_id = ? AND status = 'blocked'",
+                (job_id,)
+            )
+        await self.remove_users([user_id for (user_id,) in blocked])
+
+    async def purge_broadcast_recipients(self, retention_days: int):
+        """Удаление списков получателей давно завершенных рассылок"""
+        cutoff = (datetime.now(timezone.utc) - timedelta(days=retention_days)).strftime('%Y-%m-%d %H:%M:%S')
+        async with self.writer() as db:
+            await db.execute('''
+                DELETE FROM broadcast_recipients WHERE job_id IN (
+                    SELECT id FROM broadcast_jobs
+                    WHERE status != 'running' AND finished_at < ?
+                )
+            ''', (cutoff,))
+            await db.commit()
+
+    async def count_users(self):
+        """Количество пользователей из счетчика stats_counters"""
+        await self.flush()
+        async with self.reader() as db:
+            rows = await db.execute_fetchall(
+                "SELECT value FROM stats_counters WHERE name = 'total_users'"
+            )
+        return rows[0][0] if rows else 0
 
     async def get_total_stats(self):
-        """Получение общей статистики"""
-        async with aiosqlite.connect(self.db_path) as db:
-            cursor = await db.execute('SELECT COUNT(*) FROM user_stats')
-            total_users = (await cursor.fetchone())[0]
-            
-            cursor = await db.execute('SELECT SUM(messages_count) FROM user_stats')
-            total_messages = (await cursor.fetchone())[0] or 0
-            
-            cursor = await db.execute('SELECT COUNT(*) FROM feedback')
-            total_feedback = (await cursor.fetchone())[0]
-            
-            return {
-                'total_users': total_users,
-                'total_messages': total_messages,
-                'total_feedback': total_feedback
-            }
+        """Получение общей статистики из счетчиков, поддерживаемых триггерами"""
+        now = time.monotonic()
+        if self._total_stats_cache and self._total_stats_cache[0] > now:
+            return dict(self._total_stats_cache[1])
+        
+        async with self.reader() as db:
+            rows = await db.execute_fetchall('SELECT name, value FROM stats_counters')
+        stats = {'total_users': 0, 'total_messages': 0, 'total_feedback': 0}
+        stats.update(rows)
+        self._total_stats_cache = (now + self.stats_ttl, stats)
+        return dict(stats)
+
+    async def get_feed_validators(self, url: str):
+        """Сохраненные ETag и Last-Modified ленты"""
+        async with self.reader() as db:
+            rows = await db.execute_fetchall(
+                'SELECT etag, last_modified FROM feeds WHERE url = ?', (url,)
+            )
+        return tuple(rows[0]) if rows else (None, None)
+
+    async def save_feed_validators(self, url: str, etag: str, last_modified: str):
+        """Сохранение ETag и Last-Modified ленты для условных запросов"""
+        async with self.writer() as db:
+            await db.execute('''
+                INSERT INTO feeds (url, etag, last_modified, checked_at)
+                VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT(url) DO UPDATE SET
+                    etag = excluded.etag,
+                    last_modified = excluded.last_modified,
+                    checked_at = excluded.checked_at
+            ''', (url, etag, last_modified))
+            await db.commit()
+
+
+    async def get_feeds(self, enabled_only: bool = True):
+        """Список лент из реестра"""
+        query = f"SELECT {', '.join(FEED_COLUMNS)} FROM feeds"
+        if enabled_only:
+            query += ' WHERE enabled = 1'
+        async with self.reader() as db:
+            rows = await db.execute_fetchall(query + ' ORDER BY id')
+        return [dict(zip(FEED_COLUMNS, row)) for row in rows]
+
+    async def add_feed(self, url: str):
+        """Добавление (или повторное включение) ленты; возвращает ее запись"""
+        async with self.writer() as db:
+            await db.execute('''
+                INSERT INTO feeds (url) VALUES (?)
+                ON CONFLICT(url) DO UPDATE SET enabled = 1, error_count = 0
+            ''', (url,))
+            await db.commit()
+        async with self.reader() as db:
+            rows = await db.execute_fetchall(
+                f"SELECT {', '.join(FEED_COLUMNS)} FROM feeds WHERE url = ?", (url,)
+            )
+        return dict(zip(FEED_COLUMNS, rows[0]))
+
+    async def disable_feed(self, feed_id: int):
+        """Отключение ленты (валидаторы и история сохраняются)"""
+        async with self.writer() as db:
+            cursor = await db.execute('UPDATE feeds SET enabled = 0 WHERE id = ?', (feed_id,))
+            changed = cursor.rowcount
+            await cursor.close()
+            await db.commit()
+        return changed > 0
+
+    async def update_feed_schedule(self, feed_id: int, poll_interval: float,
+                                   error_count: int, last_error: str = None):
+        """Сохранение подобранного интервала опроса и счетчика ошибок"""
+        async with self.writer() as db:
+            await db.execute('''
+                UPDATE feeds
+                SET poll_interval = ?, error_count = ?, last_error = ?, checked_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', (poll_interval, error_count, last_error, feed_id))
+            await db.commit()
+
+
+    async def filter_unseen_entries(self, keys: list):
+        """Ключи записей, которых еще нет в seen_entries (порядок сохраняется)"""
+        if not keys:
+            return []
+        seen = set()
+        # Ограничение SQLite на число параметров в одном запросе
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            async with self.reader() as db:
+                rows = await db.execute_fetchall(
+                    f"SELECT key FROM seen_entries WHERE key IN ({', '.join('?' * len(chunk))})",
+                    chunk
+                )
+            seen.update(key for (key,) in rows)
+        return [key for key in keys if key not in seen]
+
+    async def mark_entries_seen(self, keys: list, seen_at: float = None):
+        """Добавление ключей записей в seen_entries"""
+        if not keys:
+            return
+        seen_at = seen_at if seen_at is not None else time.time()
+        async with self.writer() as db:
+            await db.executemany(
+                'INSERT OR IGNORE INTO seen_entries (key, seen_at) VALUES (?, ?)',
+                [(key, seen_at) for key in keys]
+            )
+            await db.commit()
+
+    async def claim_entries(self, keys: list, seen_at: float = None) -> list:
+        """Вставка ключей в seen_entries; возвращает только вставленные этим вызовом.
+
+        Вставка - и проверка, и захват: при нескольких процессах ключ достается одному
+        """
+        if not keys:
+            return []
+        seen_at = seen_at if seen_at is not None else time.time()
+        claimed = []
+        async with self.writer() as db:
+            for key in keys:
+                cursor = await db.execute(
+                    'INSERT OR IGNORE INTO seen_entries (key, seen_at) VALUES (?, ?)', (key, seen_at)
+                )
+                if cursor.rowcount:
+                    claimed.append(key)
+                await cursor.close()
+            await db.commit()
+        return claimed
+
+    async def evict_seen_entries(self, older_than: float):
+        """Удаление ключей, увиденных раньше older_than (unix time)"""
+        async with self.writer() as db:
+            cursor = await db.execute('DELETE FROM seen_entries WHERE seen_at < ?', (older_than,))
+            evicted = cursor.rowcount
+            await cursor.close()
+            await db.commit()
+        return evicted
+
+
+    async def get_news_fingerprints(self, since: float):
+        """SimHash-отпечатки новостей, увиденных после since (unix time)"""
+        async with self.reader() as db:
+            rows = await db.execute_fetchall(
+                'SELECT simhash, seen_at FROM news_fingerprints WHERE seen_at >= ?', (since,)
+            )
+        return rows
+
+    async def add_news_fingerprint(self, simhash: int, seen_at: float):
+        """Сохранение отпечатка (знаковое 64-битное представление)"""
+        async with self.writer() as db:
+            await db.execute(
+                'INSERT OR REPLACE INTO news_fingerprints (simhash, seen_at) VALUES (?, ?)',
+                (simhash, seen_at)
+            )
+            await db.commit()
+
+    async def evict_news_fingerprints(self, older_than: float):
+        """Удаление отпечатков старше older_than (unix time)"""
+        async with self.writer() as db:
+            cursor = await db.execute('DELETE FROM news_fingerprints WHERE seen_at < ?', (older_than,))
+            evicted = cursor.rowcount
+            await cursor.close()
+            await db.commit()
+        return evicted
+
+    async def enqueue_post(self, chat_id, text: str, next_attempt_at: float,
+                           attempts: int = 1, last_error: str = None):
+        """Постановка неотправленного поста в очередь повторов"""
+        async with self.writer() as db:
+            await db.execute('''
+                INSERT INTO post_queue (chat_id, text, attempts, next_attempt_at, last_error)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (str(chat_id), text, attempts, next_attempt_at, last_error))
+            await db.commit()
+
+    async def get_due_posts(self, now: float, limit: int = 20):
+        """Посты из очереди повторов, время попытки которых наступило"""
+        async with self.reader() as db:
+            rows = await db.execute_fetchall('''
+                SELECT id, chat_id, text, attempts FROM post_queue
+                WHERE next_attempt_at <= ?
+                ORDER BY next_attempt_at
+                LIMIT ?
+            ''', (now, limit))
+        return [dict(zip(('id', 'chat_id', 'text', 'attempts'), row)) for row in rows]
+
+    async def reschedule_post(self, post_id: int, attempts: int, next_attempt_at: float, last_error: str):
+        """Перенос попытки отправки поста"""
+        async with self.writer() as db:
+            await db.execute(
+                'UPDATE post_queue SET attempts = ?, next_attempt_at = ?, last_error = ? WHERE id = ?',
+                (attempts, next_attempt_at, last_error, post_id)
+            )
+            await db.commit()
+
+    async def delete_post(self, post_id: int):
+        """Удаление поста из очереди повторов (отправлен или отброшен)"""
+        async with self.writer() as db:
+            await db.execute('DELETE FROM post_queue WHERE id = ?', (post_id,))
+            await db.commit()
+
+    async def count_queued_posts(self):
+        """Количество постов в очереди повторов"""
+        async with self.reader() as db:
+            async with db.execute('SELECT COUNT(*) FROM post_queue') as cursor:
+                row = await cursor.fetchone()
+        return row[0]
+
+    async def get_chat_bad_words(self, chat_id: int):
+        """Запрещенные слова, добавленные в чате"""
+        async with self.reader() as db:
+            rows = await db.execute_fetchall(
+                'SELECT word FROM chat_bad_words WHERE chat_id = ? ORDER BY word', (chat_id,)
+            )
+        return [row[0] for row in rows]
+
+    async def get_chat_word_version(self, chat_id: int) -> int:
+        """Версия списка слов чата (растет при каждом добавлении и удалении)"""
+        async with self.reader() as db:
+            async with db.execute(
+                'SELECT version FROM chat_word_versions WHERE chat_id = ?', (chat_id,)
+            ) as cursor:
+                row = await cursor.fetchone()
+        return row[0] if row else 0
+
+    async def add_chat_bad_words(self, chat_id: int, words: list, added_by: int = None):
+        """Добавление слов в список чата; возвращает количество новых"""
+        # rowcount, а не total_changes: тот учитывает и строки триггера версий
+        async with self.writer() as db:
+            cursor = await db.executemany(
+                'INSERT OR IGNORE INTO chat_bad_words (chat_id, word, added_by) VALUES (?, ?, ?)',
+                [(chat_id, word, added_by) for word in words]
+            )
+            added = cursor.rowcount
+            await cursor.close()
+            await db.commit()
+        return added
+
+    async def remove_chat_bad_words(self, chat_id: int, words: list):
+        """Удаление слов из списка чата; возвращает количество удаленных"""
+        async with self.writer() as db:
+            cursor = await db.executemany(
+                'DELETE FROM chat_bad_words WHERE chat_id = ? AND word = ?',
+                [(chat_id, word) for word in words]
+            )
+            removed = cursor.rowcount
+            await cursor.close()
+            await db.commit()
+        return removed
+
+    async def log_warnings(self, warnings: list):
+        """Запись предупреждений (chat_id, user_id, warned_at) и увеличение warnings_count.
+
+        Строки user_stats не создаются: участники групп, не писавшие боту,
+        учитываются только в user_warnings
+        """
+        for _, user_id, _ in warnings:
+            self.user_cache.update(user_id, warnings_count=lambda count: count + 1)
+        if self.flush_interval:
+            self._pending_warnings.extend(warnings)
+            self._schedule_flush()
+            return
+
+        async with self.writer() as db:
+            await self._write_warnings(db, warnings)
+            await db.commit()
+
+    async def _write_warnings(self, db, warnings: list):
+        await db.executemany(
+            'INSERT INTO user_warnings (chat_id, user_id, warned_at) VALUES (?, ?, ?)', warnings
+        )
+        per_user = Counter(user_id for _, user_id, _ in warnings)
+        await db.executemany(
+            'UPDATE user_stats SET warnings_count = warnings_count + ? WHERE user_id = ?',
+            [(count, user_id) for user_id, count in per_user.items()]
+        )
+
+    async def delete_user_warnings(self, chat_id: int, user_id: int):
+        """Удаление предупреждений пользователя в чате (после наказания окно начинается заново)"""
+        self._pending_warnings = [
+            warning for warning in self._pending_warnings
+            if (warning[0], warning[1]) != (chat_id, user_id)
+        ]
+        async with self.writer() as db:
+            await db.execute(
+                'DELETE FROM user_warnings WHERE chat_id = ? AND user_id = ?', (chat_id, user_id)
+            )
+            await db.commit()
+
+    async def get_recent_warnings(self, since: float):
+        """Предупреждения, выданные после since (unix time)"""
+        await self.flush()
+        async with self.reader() as db:
+            rows = await db.execute_fetchall('''
+                SELECT chat_id, user_id, warned_at FROM user_warnings
+                WHERE warned_at >= ?
+                ORDER BY warned_at
+            ''', (since,))
+        return rows
+
+    async def purge_user_warnings(self, retention_days: int):
+        """Удаление истории предупреждений старше retention_days"""
+        cutoff = time.time() - retention_days * 24 * 3600
+        async with self.writer() as db:
+            cursor = await db.execute('DELETE FROM user_warnings WHERE warned_at < ?', (cutoff,))
+            purged = cursor.rowcount
+            await cursor.close()
+            await db.commit()
+        return purged
+
+    async def get_state_value(self, key: str, now: float):
+        """Значение общего состояния (JSON), если срок его жизни не истек"""
+        async with self.reader() as db:
+            async with db.execute(
+                'SELECT value FROM kv_state WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)',
+                (key, now)
+            ) as cursor:
+                row = await cursor.fetchone()
+        return row[0] if row else None
+
+    async def set_state_value(self, key: str, value: str, expires_at: float = None):
+        """Запись значения общего состояния"""
+        async with self.writer() as db:
+            await db.execute('''
+                INSERT INTO kv_state (key, value, expires_at) VALUES (?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at
+            ''', (key, value, expires_at))
+            await db.commit()
+
+    async def delete_state_value(self, key: str):
+        """Удаление значения; True, если оно было"""
+        async with self.writer() as db:
+            cursor = await db.execute('DELETE FROM kv_state WHERE key = ?', (key,))
+            deleted = cursor.rowcount > 0
+            await cursor.close()
+            await db.commit()
+        return deleted
+
+    async def purge_expired_state(self, now: float):
+        """Удаление истекших значений общего состояния"""
+        async with self.writer() as db:
+            cursor = await db.execute('DELETE FROM kv_state WHERE expires_at <= ?', (now,))
+            purged = cursor.rowcount
+            await cursor.close()
+            await db.commit()
+        return purged
 
 
-db = Database()
\ No newline at end of file
+db = Database(
+    flush_interval=int(os.getenv('DB_FLUSH_INTERVAL_MS', '500')) / 1000,
+    max_batch=int(os.getenv('DB_FLUSH_MAX_ROWS', '500'))
+)
\ No newline at end of file
@@ -0,0 +1,207 @@
+import asyncio
+import hashlib
+import html
+import os
+import pickle
+import re
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+from loguru import logger
+
+from database import db
+
+# Сколько помнить уже опубликованные ссылки
+SEEN_TTL_DAYS = 30
+# Сколько последних ключей держать в памяти, чтобы повторный опрос
+# той же ленты не ходил в БД
+MEMORY_CACHE_SIZE = 5000
+LEGACY_STATE_FILE = 'last_entries.pkl'
+
+# Параметры ссылок, не влияющие на содержимое страницы
+TRACKING_PARAMS = {'fbclid', 'gclid', 'yclid', 'ysclid', '_openstat', 'from', 'ref', 'source'}
+TRACKING_PREFIXES = ('utm_',)
+
+# SimHash: 64 бита, 4 полосы по 16. Если расстояние Хэмминга <= 3, то
+# по принципу Дирихле хотя бы одна полоса совпадает точно - по ней и ищем
+SIMHASH_BITS = 64
+SIMHASH_BANDS = 4
+MAX_HAMMING_DISTANCE = 3
+# Для совсем коротких текстов отпечаток ненадежен
+MIN_SIMHASH_TOKENS = 6
+
+_TAG_RE = re.compile(r'<[^>]+>')
+_WORD_RE = re.compile(r'\w+')
+
+
+def canonicalize_url(url: str) -> str:
+    """Каноническая ссылка: без фрагмента и трекинговых параметров, хост в нижнем регистре"""
+    parts = urlsplit(url.strip())
+    query = [
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if key.lower() not in TRACKING_PARAMS and not key.lower().startswith(TRACKING_PREFIXES)
+    ]
+    return urlunsplit((
+        parts.scheme.lower(),
+        parts.netloc.lower(),
+        parts.path or '/',
+        urlencode(sorted(query)),
+        ''
+    ))
+
+
+def _features(text: str) -> list:
+    tokens = _WORD_RE.findall(html.unescape(_TAG_RE.sub(' ', text)).lower().replace('ё', 'е'))
+    return tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+
+
+def simhash(text: str):
+    """64-битный SimHash по словам и парам слов; None для слишком короткого текста"""
+    features = _features(text)
+    if len(features) < MIN_SIMHASH_TOKENS:
+        return None
+    weights = [0] * SIMHASH_BITS
+    for feature in features:
+        h = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), 'big')
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += 1 if h >> bit & 1 else -1
+    return sum(1 << bit for bit, weight in enumerate(weights) if weight > 0)
+
+
+def _to_signed(value: int) -> int:
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _to_unsigned(value: int) -> int:
+    return value + (1 << 64) if value < 0 else value
+
+
+class DedupeStore:
+    """Хранилище уже виденных записей: таблица seen_entries с TTL и LRU-кэш в памяти"""
+
+    def __init__(self, ttl_days: int = SEEN_TTL_DAYS, cache_size: int = MEMORY_CACHE_SIZE):
+        self.ttl = ttl_days * 24 * 3600
+        self.cache_size = cache_size
+        self._recent = OrderedDict()
+
+    def _remember(self, keys):
+        for key in keys:
+            self._recent[key] = None
+            self._recent.move_to_end(key)
+        while len(self._recent) > self.cache_size:
+            self._recent.popitem(last=False)
+
+    async def filter_new(self, keys: list) -> list:
+        """Ключи, которые еще не встречались (без повторов, порядок сохраняется)"""
+        candidates = [key for key in dict.fromkeys(keys) if key not in self._recent]
+        new_keys = await db.filter_unseen_entries(candidates)
+        fresh = set(new_keys)
+        self._remember(key for key in candidates if key not in fresh)
+        return new_keys
+
+    async def add(self, keys: list):
+        """Запоминание ключей: одна вставка только новых строк"""
+        await db.mark_entries_seen(keys)
+        self._remember(keys)
+
+    async def claim(self, keys: list) -> list:
+        """Атомарно отобрать новые ключи и запомнить их.
+
+        Захват решает вставка в БД, поэтому ключ достается одной ленте
+        и одному процессу; кэш в памяти только отсекает уже известные ключи
+        """
+        candidates = [key for key in dict.fromkeys(keys) if key not in self._recent]
+        new_keys = await db.claim_entries(candidates)
+        self._remember(candidates)
+        return new_keys
+
+    async def evict(self):
+        """Удаление ключей старше TTL"""
+        evicted = await db.evict_seen_entries(time.time() - self.ttl)
+        if evicted:
+            logger.info(f"Удалено {evicted} устаревших записей дедупликации RSS")
+        return evicted
+
+    async def import_legacy(self, path: str = LEGACY_STATE_FILE):
+        """Одноразовый перенос множества ссылок из старого pickle-файла"""
+        if not os.path.exists(path):
+            return
+        try:
+            with open(path, 'rb') as f:
+                links = list(pickle.load(f))
+            await db.mark_entries_seen(links, seen_at=os.path.getmtime(path))
+            os.replace(path, path + '.imported')
+            logger.info(f"Перенесено {len(links)} ссылок из {path} в базу данных")
+        except Exception as e:
+            logger.error(f"Ошибка переноса {path}: {e}")
+
+
+class SimHashIndex:
+    """Индекс SimHash-отпечатков новостей для поиска почти-дубликатов"""
+
+    def __init__(self, ttl_days: int = SEEN_TTL_DAYS, max_distance: int = MAX_HAMMING_DISTANCE):
+        self.ttl = ttl_days * 24 * 3600
+        self.max_distance = max_distance
+        self._band_bits = SIMHASH_BITS // SIMHASH_BANDS
+        self._band_mask = (1 << self._band_bits) - 1
+        self._bands = [{} for _ in range(SIMHASH_BANDS)]
+        self._seen_at = {}
+        self._lock = asyncio.Lock()
+        self._loaded = False
+
+    def _band_keys(self, fingerprint: int):
+        return [(fingerprint >> (i * self._band_bits)) & self._band_mask for i in range(SIMHASH_BANDS)]
+
+    def _insert(self, fingerprint: int, seen_at: float):
+        self._seen_at[fingerprint] = seen_at
+        for band, key in zip(self._bands, self._band_keys(fingerprint)):
+            band.setdefault(key, set()).add(fingerprint)
+
+    def _discard(self, fingerprint: int):
+        self._seen_at.pop(fingerprint, None)
+        for band, key in zip(self._bands, self._band_keys(fingerprint)):
+            bucket = band.get(key)
+            if bucket:
+                bucket.discard(fingerprint)
+                if not bucket:
+                    del band[key]
+
+    def find(self, fingerprint: int):
+        """Ближайший сохраненный отпечаток на расстоянии не больше max_distance"""
+        for band, key in zip(self._bands, self._band_keys(fingerprint)):
+            for candidate in band.get(key, ()):
+                if bin(candidate ^ fingerprint).count('1') <= self.max_distance:
+                    return candidate
+        return None
+
+    async def load(self):
+        """Загрузка отпечатков в пределах TTL из базы данных"""
+        for fingerprint, seen_at in await db.get_news_fingerprints(time.time() - self.ttl):
+            self._insert(_to_unsigned(fingerprint), seen_at)
+        self._loaded = True
+
+    async def claim(self, text: str) -> bool:
+        """True, если похожей новости еще не было (отпечаток запоминается)"""
+        fingerprint = simhash(text)
+        if fingerprint is None:
+            return True
+        async with self._lock:
+            if not self._loaded:
+                await self.load()
+            if self.find(fingerprint) is not None:
+                return False
+            now = time.time()
+            self._insert(fingerprint, now)
+            await db.add_news_fingerprint(_to_signed(fingerprint), now)
+        return True
+
+    async def evict(self):
+        """Удаление отпечатков старше TTL из памяти и базы"""
+        cutoff = time.time() - self.ttl
+        for fingerprint in [fp for fp, seen_at in self._seen_at.items() if seen_at < cutoff]:
+            self._discard(fingerprint)
+        return await db.evict_news_fingerprints(cutoff)
+
+
+news_dedupe = DedupeStore()
+news_fingerprints = SimHashIndex()
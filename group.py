@@ -1,29 +1,45 @@
 import random
-import re
+import time
 from aiogram import Dispatcher, types, F
+from aiogram.types import ChatPermissions
 from aiogram.filters import Command
 from loguru import logger
 
-group_games = {}
+from moderation import ChatWordLists, warning_ledger, MUTE_DURATION
+from middlewares import flood_middleware
+from storage import state_backend
+
+# Игры хранятся в общем хранилище состояния, брошенные истекают через GAME_TTL
+GAME_TTL = 24 * 3600
+
+
+def game_key(chat_id: int) -> str:
+    return f"group_game:{chat_id}"
 
 
 BAD_WORDS = [
     'мат1', 'мат2', 'мат3', 'плохоеслово', 'оскорбление'
     
 ]
+chat_words = ChatWordLists(BAD_WORDS)
+
+
+async def is_chat_admin(message: types.Message) -> bool:
+    """Является ли автор сообщения администратором чата"""
+    member = await message.bot.get_chat_member(message.chat.id, message.from_user.id)
+    return member.status in ('administrator', 'creator')
+
 
 def setup_group_handlers(dp: Dispatcher):
     
+    # Флуд отсекается до фильтров и обработчиков
+    dp.message.outer_middleware(flood_middleware)
+    
     
     @dp.message(F.chat.type.in_({"group", "supergroup"}) & ~F.text.startswith('/'))
     async def filter_bad_words(message: types.Message):
         
-        text = message.text.lower() if message.text else ""
-        
-        found_bad_words = []
-        for word in BAD_WORDS:
-            if re.search(r'\b' + re.escape(word) + r'\b', text, re.IGNORECASE):
-                found_bad_words.append(word)
+        found_bad_words = await chat_words.find_all(message.chat.id, message.text)
         
         if found_bad_words:
             
@@ -34,10 +50,31 @@ def setup_group_handlers(dp: Dispatcher):
                 logger.error(f"Не удалось удалить сообщение: {e}")
             
             
+            warnings = await warning_ledger.warn(message.chat.id, message.from_user.id)
             warning_msg = (
                 f"⚠️ {message.from_user.first_name}, пожалуйста, не используйте ненормативную лексику!\n"
-                f"Обнаружены запрещенные слова: {', '.join(found_bad_words)}"
+                f"Обнаружены запрещенные слова: {', '.join(found_bad_words)}\n"
+                f"Предупреждение {warnings}/{warning_ledger.ban_after}"
             )
+            
+            punishment = warning_ledger.escalation(warnings)
+            try:
+                if punishment == 'ban':
+                    await message.bot.ban_chat_member(message.chat.id, message.from_user.id)
+                    await warning_ledger.reset(message.chat.id, message.from_user.id)
+                    warning_msg += "\n🚫 Пользователь заблокирован"
+                elif punishment == 'mute':
+                    await message.bot.restrict_chat_member(
+                        message.chat.id, message.from_user.id,
+                        permissions=ChatPermissions(can_send_messages=False),
+                        until_date=int(time.time()) + MUTE_DURATION
+                    )
+                    warning_msg += f"\n🔇 Пользователь лишен права писать на {MUTE_DURATION // 60} мин."
+                if punishment:
+                    logger.info(f"Группа: {punishment} для {message.from_user.id} в {message.chat.id}")
+            except Exception as e:
+                logger.error(f"Не удалось наказать пользователя {message.from_user.id}: {e}")
+            
             await message.answer(warning_msg)
 
     @dp.message(Command('start_game'),
@@ -45,7 +82,7 @@ def setup_group_handlers(dp: Dispatcher):
     async def start_game(message: types.Message):
         chat_id = message.chat.id
         secret_number = random.randint(1, 100)
-        group_games[chat_id] = secret_number
+        await state_backend.set(game_key(chat_id), secret_number, GAME_TTL)
         
         
         game_announcement = (
@@ -64,7 +101,8 @@ def setup_group_handlers(dp: Dispatcher):
     @dp.message(Command('guess'), F.chat.type.in_({"group", "supergroup"}))
     async def make_guess(message: types.Message):
         chat_id = message.chat.id
-        if chat_id not in group_games:
+        secret = await state_backend.get(game_key(chat_id))
+        if secret is None:
             
             await message.answer(
                 "🎯 Игра не активна! Хотите начать?\n"
@@ -87,7 +125,6 @@ def setup_group_handlers(dp: Dispatcher):
             await message.answer("📏 Число должно быть от 1 до 100!")
             return
 
-        secret = group_games[chat_id]
         user_name = message.from_user.first_name
 
         if guess < secret:
@@ -103,15 +140,17 @@ def setup_group_handlers(dp: Dispatcher):
                 f"🎮 Хотите сыграть еще?\n"
                 f"Напишите: /start_game"
             )
+            # Удаление атомарно: при нескольких процессах побеждает только один
+            if not await state_backend.delete(game_key(chat_id)):
+                return
             await message.answer(victory_message, parse_mode="HTML")
-            del group_games[chat_id]
             logger.info(f"Группа: игра завершена в {chat_id}, победитель {user_name}")
 
     
     @dp.message(Command('game_status'), F.chat.type.in_({"group", "supergroup"}))
     async def game_status(message: types.Message):
         chat_id = message.chat.id
-        if chat_id in group_games:
+        if await state_backend.get(game_key(chat_id)) is not None:
             await message.answer(
                 "🎮 Игра активна!\n"
                 "🔢 Число загадано, угадывайте!\n\n"
@@ -126,8 +165,42 @@ def setup_group_handlers(dp: Dispatcher):
     
     @dp.message(Command('badwords'), F.chat.type.in_({"group", "supergroup"}))
     async def show_bad_words(message: types.Message):
+        words = await chat_words.words(message.chat.id)
         await message.answer(
             f"📋 Список запрещенных слов:\n" +
-            "\n".join([f"• {word}" for word in BAD_WORDS]) +
+            "\n".join([f"• {word}" for word in words]) +
             "\n\n❌ Использование этих слов приведет к удалению сообщения!"
-        )
\ No newline at end of file
+        )
+
+    @dp.message(Command('badword_add'), F.chat.type.in_({"group", "supergroup"}))
+    async def add_bad_words(message: types.Message):
+        if not await is_chat_admin(message):
+            await message.answer("❌ Эта команда доступна только администраторам чата")
+            return
+        
+        words = [word.lower() for word in message.text.split()[1:]]
+        if not words:
+            await message.answer("Использование: /badword_add слово [слово ...]")
+            return
+        
+        added = await chat_words.add(message.chat.id, words, message.from_user.id)
+        await message.answer(f"✅ Добавлено слов: {added}")
+        logger.info(f"Группа: в {message.chat.id} добавлены запрещенные слова: {words}")
+
+    @dp.message(Command('badword_remove'), F.chat.type.in_({"group", "supergroup"}))
+    async def remove_bad_words(message: types.Message):
+        if not await is_chat_admin(message):
+            await message.answer("❌ Эта команда доступна только администраторам чата")
+            return
+        
+        words = [word.lower() for word in message.text.split()[1:]]
+        if not words:
+            await message.answer("Использование: /badword_remove слово [слово ...]")
+            return
+        
+        removed = await chat_words.remove(message.chat.id, words)
+        await message.answer(
+            f"✅ Удалено слов: {removed}" if removed
+            else "❌ Этих слов нет в списке чата (общий список изменить нельзя)"
+        )
+        logger.info(f"Группа: в {message.chat.id} удалены запрещенные слова: {words}")
\ No newline at end of file
@@ -1,81 +1,177 @@
+from functools import lru_cache
+from typing import Tuple
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
+from pydantic import ConfigDict, field_serializer
 import os
 
+DEFAULT_LANG = 'ru'
 
-def get_main_keyboard():
-    return ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(text="📊 Статистика"), KeyboardButton(text="📝 Обратная связь")],
-            [KeyboardButton(text="❓ Помощь"), KeyboardButton(text="📢 Канал")],
-            [KeyboardButton(text="🎮 Игры"), KeyboardButton(text="⚙️ Настройки")]
-        ],
+# Подписи кнопок по языкам; недостающие берутся из DEFAULT_LANG.
+# Обработчики сравнивают текст кнопок с русскими подписями
+LABELS = {
+    'ru': {
+        'stats': "📊 Статистика",
+        'feedback': "📝 Обратная связь",
+        'help': "❓ Помощь",
+        'channel': "📢 Канал",
+        'games': "🎮 Игры",
+        'settings': "⚙️ Настройки",
+        'guess_number': "🎯 Угадай число",
+        'random_number': "🎲 Случайное число",
+        'back': "🔙 Назад",
+        'notifications': "🔔 Уведомления",
+        'language': "🌐 Язык",
+        'main_placeholder': "Выберите действие...",
+        'subscribe': "📢 Подписаться на канал",
+        'check_subscription': "✅ Проверить подписку",
+        'contact_support': "📞 Связаться с поддержкой",
+        'rate_bot': "⭐ Оценить бота",
+        'notifications_on': "✅ Включить уведомления",
+        'notifications_off': "❌ Выключить уведомления",
+    },
+}
+
+
+# Кэшированные клавиатуры общие для всех ответов, поэтому неизменяемые:
+# присваивание полей запрещено, ряды кнопок - кортежи.
+# В запрос ряды уходят списками, JSON тот же, что у обычных клавиатур
+
+class FrozenKeyboardButton(KeyboardButton):
+    model_config = ConfigDict(frozen=True)
+
+
+class FrozenInlineKeyboardButton(InlineKeyboardButton):
+    model_config = ConfigDict(frozen=True)
+
+
+class FrozenReplyKeyboardMarkup(ReplyKeyboardMarkup):
+    model_config = ConfigDict(frozen=True)
+
+    keyboard: Tuple[Tuple[FrozenKeyboardButton, ...], ...]
+
+    @field_serializer('keyboard')
+    def _serialize_rows(self, rows):
+        return [list(row) for row in rows]
+
+
+class FrozenInlineKeyboardMarkup(InlineKeyboardMarkup):
+    model_config = ConfigDict(frozen=True)
+
+    inline_keyboard: Tuple[Tuple[FrozenInlineKeyboardButton, ...], ...]
+
+    @field_serializer('inline_keyboard')
+    def _serialize_rows(self, rows):
+        return [list(row) for row in rows]
+
+
+def _label(key: str, lang: str) -> str:
+    return LABELS.get(lang, {}).get(key) or LABELS[DEFAULT_LANG][key]
+
+
+def _reply_rows(rows, lang: str):
+    return [[FrozenKeyboardButton(text=_label(key, lang)) for key in row] for row in rows]
+
+
+# Клавиатуры собираются один раз на язык и переиспользуются во всех ответах
+
+@lru_cache(maxsize=16)
+def get_main_keyboard(lang: str = DEFAULT_LANG):
+    return FrozenReplyKeyboardMarkup(
+        keyboard=_reply_rows([
+            ['stats', 'feedback'],
+            ['help', 'channel'],
+            ['games', 'settings']
+        ], lang),
         resize_keyboard=True,
-        input_field_placeholder="Выберите действие..."
+        input_field_placeholder=_label('main_placeholder', lang)
     )
 
 
-def get_games_keyboard():
-    return ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(text="🎯 Угадай число"), KeyboardButton(text="🎲 Случайное число")],
-            [KeyboardButton(text="🔙 Назад")]
-        ],
+@lru_cache(maxsize=16)
+def get_games_keyboard(lang: str = DEFAULT_LANG):
+    return FrozenReplyKeyboardMarkup(
+        keyboard=_reply_rows([
+            ['guess_number', 'random_number'],
+            ['back']
+        ], lang),
         resize_keyboard=True
     )
 
 
-def get_back_keyboard():
-    return ReplyKeyboardMarkup(
-        keyboard=[[KeyboardButton(text="🔙 Назад")]],
+@lru_cache(maxsize=16)
+def get_back_keyboard(lang: str = DEFAULT_LANG):
+    return FrozenReplyKeyboardMarkup(
+        keyboard=_reply_rows([['back']], lang),
         resize_keyboard=True
     )
 
 
-def get_channel_inline_keyboard():
-    return InlineKeyboardMarkup(
+@lru_cache(maxsize=16)
+def get_channel_inline_keyboard(lang: str = DEFAULT_LANG):
+    return FrozenInlineKeyboardMarkup(
         inline_keyboard=[
-            [InlineKeyboardButton(text="📢 Подписаться на канал", url=f"https://t.me/{CHANNEL_ID[1:]}")],
-            [InlineKeyboardButton(text="✅ Проверить подписку", callback_data="check_subscription")]
+            [FrozenInlineKeyboardButton(text=_label('subscribe', lang), url=f"https://t.me/{CHANNEL_ID[1:]}")],
+            [FrozenInlineKeyboardButton(text=_label('check_subscription', lang), callback_data="check_subscription")]
         ]
     )
 
 
-def get_feedback_inline_keyboard():
-    return InlineKeyboardMarkup(
+@lru_cache(maxsize=16)
+def get_feedback_inline_keyboard(lang: str = DEFAULT_LANG):
+    return FrozenInlineKeyboardMarkup(
         inline_keyboard=[
-            [InlineKeyboardButton(text="📞 Связаться с поддержкой", url="https://t.me/username")],
-            [InlineKeyboardButton(text="⭐ Оценить бота", callback_data="rate_bot")]
+            [FrozenInlineKeyboardButton(text=_label('contact_support', lang), url="https://t.me/username")],
+            [FrozenInlineKeyboardButton(text=_label('rate_bot', lang), callback_data="rate_bot")]
         ]
     )
 
 
-def get_settings_keyboard():
-    return ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(text="🔔 Уведомления"), KeyboardButton(text="🌐 Язык")],
-            [KeyboardButton(text="🔙 Назад")]
-        ],
+@lru_cache(maxsize=16)
+def get_settings_keyboard(lang: str = DEFAULT_LANG):
+    return FrozenReplyKeyboardMarkup(
+        keyboard=_reply_rows([
+            ['notifications', 'language'],
+            ['back']
+        ], lang),
         resize_keyboard=True
     )
 
 
-def get_notifications_keyboard():
-    return InlineKeyboardMarkup(
+@lru_cache(maxsize=16)
+def get_notifications_keyboard(lang: str = DEFAULT_LANG):
+    return FrozenInlineKeyboardMarkup(
         inline_keyboard=[
-            [InlineKeyboardButton(text="✅ Включить уведомления", callback_data="notifications_on")],
-            [InlineKeyboardButton(text="❌ Выключить уведомления", callback_data="notifications_off")]
+            [FrozenInlineKeyboardButton(text=_label('notifications_on', lang), callback_data="notifications_on")],
+            [FrozenInlineKeyboardButton(text=_label('notifications_off', lang), callback_data="notifications_off")]
         ]
     )
 
 
+@lru_cache(maxsize=1)
 def get_language_keyboard():
-    return InlineKeyboardMarkup(
+    return FrozenInlineKeyboardMarkup(
         inline_keyboard=[
-            [InlineKeyboardButton(text="🇷🇺 Русский", callback_data="lang_ru")],
-            [InlineKeyboardButton(text="🇺🇸 English", callback_data="lang_en")],
-            [InlineKeyboardButton(text="🇪🇸 Español", callback_data="lang_es")]
+            [FrozenInlineKeyboardButton(text="🇷🇺 Русский", callback_data="lang_ru")],
+            [FrozenInlineKeyboardButton(text="🇺🇸 English", callback_data="lang_en")],
+            [FrozenInlineKeyboardButton(text="🇪🇸 Español", callback_data="lang_es")]
         ]
     )
 
 
-CHANNEL_ID = os.getenv('CHANNEL_ID')
\ No newline at end of file
+def get_users_pagination_keyboard(page: int, first_cursor=None, last_cursor=None):
+    """Кнопки листания списка пользователей; курсор - (last_seen, user_id)"""
+    buttons = []
+    if first_cursor:
+        buttons.append(InlineKeyboardButton(
+            text="⬅️ Назад",
+            callback_data=f"users|prev|{page - 1}|{first_cursor[0]}|{first_cursor[1]}"
+        ))
+    if last_cursor:
+        buttons.append(InlineKeyboardButton(
+            text="Вперед ➡️",
+            callback_data=f"users|next|{page + 1}|{last_cursor[0]}|{last_cursor[1]}"
+        ))
+    return InlineKeyboardMarkup(inline_keyboard=[buttons] if buttons else [])
+
+
+CHANNEL_ID = os.getenv('CHANNEL_ID')
@@ -1,77 +1,47 @@
 import os
 import asyncio
-import feedparser
 
 from aiogram import Bot, Dispatcher, types
 from aiogram.filters import Command
 from dotenv import load_dotenv, find_dotenv
 from loguru import logger
-import pickle
 
 load_dotenv(find_dotenv())
 TOKEN = os.getenv('TOKEN')
 CHANNEL_ID = os.getenv('CHANNEL_ID')
 ADMIN_IDS = list(map(int, os.getenv('ADMIN_IDS', '').split(','))) if os.getenv('ADMIN_IDS') else []
+ACTIONS_RETENTION_DAYS = int(os.getenv('ACTIONS_RETENTION_DAYS', '30'))
+DB_MAINTENANCE_INTERVAL = 3600
+# Конвейер новостей и возобновление рассылок - только в одном процессе,
+# в остальных рабочих процессах BACKGROUND_JOBS=0
+BACKGROUND_JOBS = os.getenv('BACKGROUND_JOBS', '1') != '0'
+
+from storage import BackendStorage, state_backend, run_sweeper
 
 bot = Bot(token=TOKEN)
-dp = Dispatcher()
+dp = Dispatcher(storage=BackendStorage(state_backend))
 
 
 from database import db
+from broadcast import broadcaster
+from rss import fetcher, feed_poller
+from dedupe import news_dedupe, news_fingerprints
+from channel import news_pipeline
+from publisher import publisher
+from moderation import warning_ledger
+from middlewares import flood_middleware, user_tracker
 
-def load_last_entries():
-    """Загрузка последних записей RSS из файла"""
-    try:
-        with open('last_entries.pkl', 'rb') as f:
-            return pickle.load(f)
-    except FileNotFoundError:
-        return set()
-
-def save_last_entries(entries):
-    """Сохранение последних записей RSS в файл"""
-    with open('last_entries.pkl', 'wb') as f:
-        pickle.dump(entries, f)
-
-async def fetch_news():
-    """Фоновая задача для получения и отправки новостей RSS"""
-    last_entries = load_last_entries()
-    
+async def db_maintenance():
+    """Фоновая задача обслуживания базы данных"""
     while True:
+        await asyncio.sleep(DB_MAINTENANCE_INTERVAL)
         try:
-            feed = feedparser.parse("https://www.sports.ru/rss/all_news.xml")
-            new_entries = []
-            
-            for entry in feed.entries:
-                if entry.link not in last_entries:
-                    new_entries.append(entry)
-                    last_entries.add(entry.link)
-            
-            
-            if new_entries:
-                save_last_entries(last_entries)
-                logger.info(f"Найдено {len(new_entries)} новых новостей")
-            
-            
-            for entry in reversed(new_entries):
-                message = f"<b>{entry.title}</b>\n\n{entry.description}\n\n<a href='{entry.link}'>Читать далее</a>"
-                try:
-                    await bot.send_message(
-                        chat_id=CHANNEL_ID,
-                        text=message,
-                        parse_mode="HTML",
-                        disable_web_page_preview=False
-                    )
-                    logger.success(f"Новость отправлена: {entry.title}")
-                except Exception as send_error:
-                    logger.error(f"Ошибка отправки новости: {send_error}")
-                
-                await asyncio.sleep(2)  
-                
+            await db.run_maintenance(ACTIONS_RETENTION_DAYS)
+            await news_dedupe.evict()
+            await news_fingerprints.evict()
+            warning_ledger.evict()
         except Exception as e:
-            logger.error(f"Ошибка в RSS парсере: {e}")
-        
-        
-        await asyncio.sleep(300)
+            logger.error(f"Ошибка обслуживания базы данных: {e}")
 
 async def setup_handlers():
     """Настройка всех обработчиков"""
@@ -104,6 +74,10 @@ async def on_startup():
         raise
     
     
+    if BACKGROUND_JOBS:
+        await broadcaster.resume(bot)
+    
+    
     bot_info = await bot.get_me()
     logger.success(f"Бот @{bot_info.username} успешно запущен!")
     logger.info(f"ID бота: {bot_info.id}")
@@ -127,6 +101,12 @@ async def on_shutdown():
     logger.info("Бот останавливается...")
     
     
+    await broadcaster.stop()
+    await fetcher.close()
+    await user_tracker.stop()
+    await dp.storage.close()
+    await db.flush()
+    await db.close()
     await bot.session.close()
     logger.success("Бот успешно остановлен")
 
@@ -162,17 +142,30 @@ async def main():
         logger.info("Запуск поллинга и RSS задачи...")
         
         
-        polling_task = asyncio.create_task(
-            dp.start_polling(bot), 
-            name="PollingTask"
-        )
-        rss_task = asyncio.create_task(
-            fetch_news(), 
-            name="RSSTask"
-        )
-        
-        
-        await asyncio.gather(polling_task, rss_task)
+        tasks = [
+            asyncio.create_task(
+                dp.start_polling(bot), 
+                name="PollingTask"
+            ),
+            asyncio.create_task(
+                db_maintenance(),
+                name="DBMaintenanceTask"
+            ),
+            asyncio.create_task(
+                run_sweeper(state_backend),
+                name="StateSweeperTask"
+            )
+        ]
+        if BACKGROUND_JOBS:
+            tasks.append(asyncio.create_task(
+                news_pipeline.run(bot), 
+                name="RSSTask"
+            ))
+        else:
+            logger.info("BACKGROUND_JOBS=0: RSS и возобновление рассылок выполняет другой процесс")
+        
+        
+        await asyncio.gather(*tasks)
         
     except KeyboardInterrupt:
         logger.info("Получен сигнал прерывания (Ctrl+C)")
@@ -216,7 +209,13 @@ async def bot_stats_command(message: types.Message):
             f"⏰ <b>Время:</b>\n"
             f"• Сервер: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
             f"• Админов: {len(ADMIN_IDS)}\n"
-            f"• RSS: 🔄 Активен\n"
+            f"• RSS: 🔄 Активен, опубликовано: {news_pipeline.published}, в очереди: {news_pipeline.pending}\n"
+            f"• RSS без изменений (304): {fetcher.not_modified}, загрузок: {fetcher.downloaded}\n"
+            f"• Постов: {publisher.sent}, дайджестов: {publisher.digests}, "
+            f"в очереди повторов: {await db.count_queued_posts()}, отброшено: {publisher.dropped}\n"
+            f"• Флуд в группах: отброшено {flood_middleware.dropped} сообщений\n"
+            f"• Кэш пользователей: {len(db.user_cache)} записей, попаданий {db.user_cache.hit_rate:.0%} "
+            f"({db.user_cache.hits}/{db.user_cache.hits + db.user_cache.misses})\n"
         )
         
         await message.answer(stats_text, parse_mode="HTML")
@@ -233,12 +232,11 @@ async def db_backup_command(message: types.Message):
         return
     
     try:
-        import shutil
         from datetime import datetime
         
         
         backup_name = f"backup_bot_{datetime.now().strftime('%Y%m%d_%H%M%S')}.db"
-        shutil.copy2('bot.db', backup_name)
+        await db.backup(backup_name)
         
         await message.answer(f"✅ Резервная копия создана: `{backup_name}`", parse_mode="Markdown")
         logger.info(f"Создана резервная копия БД: {backup_name}")
@@ -247,6 +245,69 @@ async def db_backup_command(message: types.Message):
         logger.error(f"Ошибка создания резервной копии: {e}")
         await message.answer("❌ Ошибка создания резервной копии")
 
+@dp.message(Command('feeds'))
+async def feeds_command(message: types.Message):
+    """Список RSS-лент с текущими интервалами опроса"""
+    if message.from_user.id not in ADMIN_IDS:
+        await message.answer("❌ Эта команда доступна только администраторам")
+        return
+    
+    feeds = await db.get_feeds()
+    if not feeds:
+        await message.answer("📭 Лент нет. Добавьте: /feed_add <url>")
+        return
+    
+    feeds_text = "📰 <b>RSS-ленты:</b>\n\n"
+    for feed in feeds:
+        interval = feed_poller.intervals.get(feed['id'], feed['poll_interval'])
+        feeds_text += f"{feed['id']}. {feed['url']}\n   Опрос раз в {interval:.0f} сек."
+        if feed['error_count']:
+            feeds_text += f" | ⚠️ Ошибок подряд: {feed['error_count']}"
+        feeds_text += "\n"
+    feeds_text += "\n/feed_add <url> - добавить, /feed_remove <id> - отключить"
+    await message.answer(feeds_text, parse_mode="HTML", disable_web_page_preview=True)
+
+@dp.message(Command('feed_add'))
+async def feed_add_command(message: types.Message):
+    """Добавление RSS-ленты в реестр"""
+    if message.from_user.id not in ADMIN_IDS:
+        await message.answer("❌ Эта команда доступна только администраторам")
+        return
+    
+    args = message.text.split()
+    if len(args) < 2 or not args[1].startswith(('http://', 'https://')):
+        await message.answer("Использование: /feed_add <url>")
+        return
+    
+    try:
+        feed = await db.add_feed(args[1])
+        feed_poller.add(feed)
+        await message.answer(f"✅ Лента #{feed['id']} добавлена: {feed['url']}")
+        logger.info(f"Добавлена RSS-лента: {feed['url']}")
+    except Exception as e:
+        logger.error(f"Ошибка добавления ленты: {e}")
+        await message.answer("❌ Ошибка добавления ленты")
+
+@dp.message(Command('feed_remove'))
+async def feed_remove_command(message: types.Message):
+    """Отключение RSS-ленты"""
+    if message.from_user.id not in ADMIN_IDS:
+        await message.answer("❌ Эта команда доступна только администраторам")
+        return
+    
+    try:
+        feed_id = int(message.text.split()[1])
+    except (IndexError, ValueError):
+        await message.answer("Использование: /feed_remove <id>")
+        return
+    
+    if await db.disable_feed(feed_id):
+        feed_poller.remove(feed_id)
+        await message.answer(f"✅ Лента #{feed_id} отключена")
+        logger.info(f"Отключена RSS-лента #{feed_id}")
+    else:
+        await message.answer(f"❌ Лента #{feed_id} не найдена")
+
 @dp.message(Command('user_info'))
 async def user_info_command(message: types.Message):
     """Информация о пользователе"""
@@ -0,0 +1,174 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
+from aiogram.types import ChatPermissions, Message, TelegramObject, User
+from loguru import logger
+
+from database import db
+from ratelimit import SlidingWindowCounter
+
+# Не больше FLOOD_LIMIT сообщений за FLOOD_WINDOW секунд от пользователя в группе
+FLOOD_LIMIT = 5
+FLOOD_WINDOW = 3
+FLOOD_MUTE_DURATION = 300
+
+
+class FloodMiddleware(BaseMiddleware):
+    """Защита групп от флуда: сообщения сверх лимита не доходят до обработчиков.
+
+    Нарушитель получает мут одним запросом к API, дальнейшие его сообщения
+    до конца мута отбрасываются молча. Мут запоминается только после успешного
+    ограничения; администраторы чата не ограничиваются
+    """
+
+    def __init__(self, limit: int = FLOOD_LIMIT, window: float = FLOOD_WINDOW,
+                 mute_duration: int = FLOOD_MUTE_DURATION):
+        self.counter = SlidingWindowCounter(limit, window)
+        self.mute_duration = mute_duration
+        self._muted = {}
+        # (чат, пользователь) -> до какого времени не пытаться ограничить
+        self._exempt = {}
+        self.dropped = 0
+
+    async def __call__(
+        self,
+        handler: Callable[[Message, Dict[str, Any]], Awaitable[Any]],
+        event: Message,
+        data: Dict[str, Any]
+    ) -> Any:
+        if event.chat.type not in ('group', 'supergroup') or event.from_user is None:
+            return await handler(event, data)
+        
+        key = (event.chat.id, event.from_user.id)
+        if not self.counter.hit(*key):
+            return await handler(event, data)
+        
+        now = time.time()
+        if self._muted.get(key, 0) > now:
+            self.dropped += 1
+            return None
+        # Администраторов и тех, кого ограничить не удалось, не глушим:
+        # их сообщения должны дойти до команд и фильтра слов
+        if self._exempt.get(key, 0) > now:
+            return await handler(event, data)
+        
+        self._muted = {k: until for k, until in self._muted.items() if until > now}
+        self._exempt = {k: until for k, until in self._exempt.items() if until > now}
+        if not await self._restrict(event, now):
+            self._exempt[key] = now + self.mute_duration
+            return await handler(event, data)
+        
+        self._muted[key] = now + self.mute_duration
+        self.dropped += 1
+        logger.info(f"Группа: флуд от {event.from_user.id} в {event.chat.id}, мут")
+        try:
+            await event.answer(
+                f"🚫 {event.from_user.first_name}, слишком много сообщений! "
+                f"Мут на {self.mute_duration // 60} мин."
+            )
+        except Exception as e:
+            logger.error(f"Не удалось отправить уведомление о муте: {e}")
+        return None
+
+    async def _restrict(self, event: Message, now: float) -> bool:
+        """Мут автора сообщения; False - администратор или ограничить не удалось"""
+        try:
+            member = await event.bot.get_chat_member(event.chat.id, event.from_user.id)
+            if member.status in ('administrator', 'creator'):
+                return False
+            await event.bot.restrict_chat_member(
+                event.chat.id, event.from_user.id,
+                permissions=ChatPermissions(can_send_messages=False),
+                until_date=int(now) + self.mute_duration
+            )
+        except Exception as e:
+            logger.error(f"Не удалось ограничить флудера {event.from_user.id}: {e}")
+            return False
+        return True
+
+
+class UserTracker:
+    """Учет активности пользователей без ожидания базы данных в обработчиках.
+
+    С буфером записи Database (DB_FLUSH_INTERVAL_MS > 0) учет - операция в памяти,
+    без буфера запросы выполняются фоновыми задачами
+    """
+
+    def __init__(self):
+        self._tasks = set()
+
+    async def _submit(self, coro):
+        if db.flush_interval:
+            await coro
+            return
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._done)
+
+    def _done(self, task: asyncio.Task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception():
+            logger.error(f"Ошибка учета активности: {task.exception()}")
+
+    async def track_user(self, user: User):
+        await self._submit(db.add_or_update_user({
+            'id': user.id,
+            'username': user.username,
+            'first_name': user.first_name,
+            'last_name': user.last_name
+        }))
+
+    async def log_action(self, user_id: int, action_type: str, details: str = None):
+        await self._submit(db.log_user_action(user_id, action_type, details))
+
+    async def stop(self):
+        """Ожидание незавершенных фоновых записей"""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+class UserTrackingMiddleware(BaseMiddleware):
+    """Учет пользователя один раз на апдейт в личном чате (внешний middleware)"""
+
+    def __init__(self, tracker: UserTracker):
+        self.tracker = tracker
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        # Нажатие inline-кнопки не считается сообщением
+        if isinstance(event, Message) and event.chat.type == 'private' and event.from_user:
+            await self.tracker.track_user(event.from_user)
+        return await handler(event, data)
+
+
+class ActionLogMiddleware(BaseMiddleware):
+    """Запись действия из флага обработчика: @dp.message(..., flags={'action': 'имя', 'details': '...'}).
+
+    Внутренний middleware: только он знает, какой обработчик выбран
+    """
+
+    def __init__(self, tracker: UserTracker):
+        self.tracker = tracker
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        action = get_flag(data, 'action')
+        user = data.get('event_from_user')
+        if action and user:
+            await self.tracker.log_action(user.id, action, get_flag(data, 'details'))
+        return await handler(event, data)
+
+
+flood_middleware = FloodMiddleware()
+user_tracker = UserTracker()
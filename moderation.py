@@ -0,0 +1,217 @@
+import asyncio
+import re
+import time
+from collections import OrderedDict, deque
+
+from database import db
+
+# Латинские буквы и цифры, которыми подменяют похожие кириллические
+HOMOGLYPHS = str.maketrans({
+    'a': 'а', 'b': 'в', 'c': 'с', 'e': 'е', 'h': 'н', 'k': 'к', 'm': 'м',
+    'o': 'о', 'p': 'р', 't': 'т', 'x': 'х', 'y': 'у', 'u': 'и', 'r': 'г',
+    '0': 'о', '3': 'з', '4': 'ч', '6': 'б', '@': 'а', '$': 'с', 'ё': 'е',
+})
+_REPEATS_RE = re.compile(r'(\w)\1+')
+# Сколько скомпилированных списков чатов держать в памяти
+MAX_CACHED_CHATS = 1000
+# Как часто сверять версию списка чата с БД (изменения из других процессов)
+WORDS_CHECK_INTERVAL = 5
+
+# Эскалация: предупреждения считаются в скользящем окне
+WARN_WINDOW = 24 * 3600
+MUTE_AFTER = 3
+BAN_AFTER = 5
+MUTE_DURATION = 3600
+
+
+def normalize(text: str) -> str:
+    """Приведение текста к виду для сравнения: регистр, гомоглифы, повторы букв"""
+    return _REPEATS_RE.sub(r'\1', text.lower().translate(HOMOGLYPHS))
+
+
+def _trie_pattern(node: dict) -> str:
+    """Регулярное выражение из префиксного дерева: общие префиксы проверяются один раз"""
+    end = '' in node
+    branches = [re.escape(char) + _trie_pattern(child) for char, child in sorted(node.items()) if char]
+    if not branches:
+        return ''
+    if len(branches) == 1 and not end:
+        return branches[0]
+    pattern = '(?:' + '|'.join(branches) + ')'
+    return pattern + '?' if end else pattern
+
+
+class WordMatcher:
+    """Поиск запрещенных слов за один проход по сообщению.
+
+    Слова собираются в одно регулярное выражение по префиксному дереву,
+    компиляция выполняется только при изменении списка
+    """
+
+    def __init__(self, words=()):
+        self._words = None
+        self._pattern = None
+        self._originals = {}
+        self.update(words)
+
+    @property
+    def words(self) -> frozenset:
+        return self._words
+
+    def update(self, words):
+        """Замена списка слов; без изменений список не перекомпилируется"""
+        words = frozenset(word.strip() for word in words if word.strip())
+        if words == self._words:
+            return False
+        self._words = words
+        self._originals = {}
+        trie = {}
+        for word in sorted(words):
+            key = normalize(word)
+            self._originals.setdefault(key, word)
+            node = trie
+            for char in key:
+                node = node.setdefault(char, {})
+            node[''] = True
+        self._pattern = re.compile(r'(?<!\w)' + _trie_pattern(trie) + r'(?!\w)') if trie else None
+        return True
+
+    def find_all(self, text: str) -> list:
+        """Найденные в тексте слова из списка (в исходном написании, без повторов)"""
+        if not self._pattern or not text:
+            return []
+        found = dict.fromkeys(self._originals[match.group()] for match in self._pattern.finditer(normalize(text)))
+        return list(found)
+
+
+class ChatWordLists:
+    """Списки запрещенных слов по чатам: общие слова плюс добавленные в чате.
+
+    Скомпилированные проверки кэшируются по чатам. Раз в check_interval секунд
+    версия списка сверяется с БД, так что изменения из любого процесса
+    подхватываются без перезапуска; пересборка - только при смене версии
+    """
+
+    def __init__(self, defaults=(), max_chats: int = MAX_CACHED_CHATS,
+                 check_interval: float = WORDS_CHECK_INTERVAL):
+        self.defaults = list(defaults)
+        self.max_chats = max_chats
+        self.check_interval = check_interval
+        # chat_id -> [matcher, version, checked_at]
+        self._matchers = OrderedDict()
+
+    async def words(self, chat_id: int) -> list:
+        """Общие слова и слова чата"""
+        return list(dict.fromkeys(self.defaults + await db.get_chat_bad_words(chat_id)))
+
+    async def matcher(self, chat_id: int) -> WordMatcher:
+        entry = self._matchers.get(chat_id)
+        now = time.monotonic()
+        if entry is not None:
+            self._matchers.move_to_end(chat_id)
+            if now - entry[2] < self.check_interval:
+                return entry[0]
+        # Версия читается до слов: изменение между запросами даст пересборку в следующий раз
+        version = await db.get_chat_word_version(chat_id)
+        if entry is not None and entry[1] == version:
+            entry[2] = now
+            return entry[0]
+        words = await self.words(chat_id)
+        if entry is None:
+            entry = self._matchers[chat_id] = [WordMatcher(words), version, now]
+            while len(self._matchers) > self.max_chats:
+                self._matchers.popitem(last=False)
+        else:
+            entry[0].update(words)
+            entry[1:] = [version, now]
+        return entry[0]
+
+    async def find_all(self, chat_id: int, text: str) -> list:
+        """Запрещенные слова чата, найденные в тексте"""
+        return (await self.matcher(chat_id)).find_all(text)
+
+    async def add(self, chat_id: int, words: list, added_by: int = None) -> int:
+        added = await db.add_chat_bad_words(chat_id, words, added_by)
+        if added:
+            self.invalidate(chat_id)
+        return added
+
+    async def remove(self, chat_id: int, words: list) -> int:
+        removed = await db.remove_chat_bad_words(chat_id, words)
+        if removed:
+            self.invalidate(chat_id)
+        return removed
+
+    def invalidate(self, chat_id: int):
+        self._matchers.pop(chat_id, None)
+
+
+class WarningLedger:
+    """Учет предупреждений по (чат, пользователь) в скользящем окне.
+
+    Окно считается в памяти, запись в БД идет через буфер Database пачками,
+    так что решение о наказании не требует запроса к базе на каждое сообщение
+    """
+
+    def __init__(self, window: float = WARN_WINDOW, mute_after: int = MUTE_AFTER, ban_after: int = BAN_AFTER):
+        self.window = window
+        self.mute_after = mute_after
+        self.ban_after = ban_after
+        self._warnings = {}
+        self._lock = asyncio.Lock()
+        self._loaded = False
+
+    def _prune(self, key, now: float) -> deque:
+        times = self._warnings.get(key)
+        if times is None:
+            times = self._warnings[key] = deque()
+        cutoff = now - self.window
+        while times and times[0] < cutoff:
+            times.popleft()
+        return times
+
+    async def load(self):
+        """Восстановление окна предупреждений из базы данных после перезапуска"""
+        for chat_id, user_id, warned_at in await db.get_recent_warnings(time.time() - self.window):
+            self._warnings.setdefault((chat_id, user_id), deque()).append(warned_at)
+        self._loaded = True
+
+    async def warn(self, chat_id: int, user_id: int) -> int:
+        """Новое предупреждение; возвращает число предупреждений в окне"""
+        if not self._loaded:
+            async with self._lock:
+                if not self._loaded:
+                    await self.load()
+        now = time.time()
+        times = self._prune((chat_id, user_id), now)
+        times.append(now)
+        await db.log_warnings([(chat_id, user_id, now)])
+        return len(times)
+
+    def count(self, chat_id: int, user_id: int) -> int:
+        if (chat_id, user_id) not in self._warnings:
+            return 0
+        return len(self._prune((chat_id, user_id), time.time()))
+
+    def escalation(self, count: int):
+        """Наказание за count предупреждений: 'ban', 'mute' или None"""
+        if count >= self.ban_after:
+            return 'ban'
+        if count >= self.mute_after:
+            return 'mute'
+        return None
+
+    async def reset(self, chat_id: int, user_id: int):
+        """Сброс окна предупреждений, в том числе в базе: иначе load() вернет его после перезапуска"""
+        self._warnings.pop((chat_id, user_id), None)
+        await db.delete_user_warnings(chat_id, user_id)
+
+    def evict(self):
+        """Удаление пользователей без предупреждений в окне"""
+        now = time.time()
+        for key in list(self._warnings):
+            if not self._prune(key, now):
+                del self._warnings[key]
+
+
+warning_ledger = WarningLedger()
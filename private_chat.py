@@ -1,6 +1,5 @@
 import asyncio
 import os
-import aiosqlite
 from aiogram import Dispatcher, types, F, Bot
 from aiogram.filters import Command, StateFilter
 from aiogram.fsm.context import FSMContext
@@ -16,10 +15,13 @@ from keyboards import (
     get_feedback_inline_keyboard,
     get_settings_keyboard,
     get_notifications_keyboard,
-    get_language_keyboard
+    get_language_keyboard,
+    get_users_pagination_keyboard
 )
 
 from database import db
+from broadcast import broadcaster, format_job_progress
+from middlewares import user_tracker, UserTrackingMiddleware, ActionLogMiddleware
 
 CHANNEL_ID = os.getenv('CHANNEL_ID')
 
@@ -42,28 +44,50 @@ class AdminState(StatesGroup):
     waiting_for_user_id = State()
     waiting_for_broadcast_message = State()
 
+USERS_PAGE_SIZE = 10
+
+
+async def build_users_page(users: list, page: int, has_prev: bool, has_next: bool):
+    """Текст и клавиатура страницы списка пользователей"""
+    total_users = await db.count_users()
+    
+    users_text = f"👥 <b>Список пользователей</b> (стр. {page}, всего: {total_users}):\n\n"
+    start_index = (page - 1) * USERS_PAGE_SIZE
+    for i, user in enumerate(users, start_index + 1):
+        user_id, username, first_name, last_name, messages_count, first_seen, last_seen = user
+        name = f"{first_name or ''} {last_name or ''}".strip() or "Без имени"
+        username_str = f"(@{username})" if username else ""
+        
+        users_text += (
+            f"{i}. {name} {username_str}\n"
+            f"   ID: {user_id} | Сообщений: {messages_count}\n"
+            f"   Первый визит: {first_seen.split()[0]}\n"
+            f"   Последний: {last_seen.split()[0]}\n\n"
+        )
+    
+    keyboard = get_users_pagination_keyboard(
+        page,
+        first_cursor=(users[0][6], users[0][0]) if has_prev else None,
+        last_cursor=(users[-1][6], users[-1][0]) if has_next else None
+    )
+    return users_text, keyboard
+
+
 def setup_private_handlers(dp: Dispatcher, admin_ids: list):
     
+    # Пользователь и действие записываются middleware, а не каждым обработчиком
+    dp.message.outer_middleware(UserTrackingMiddleware(user_tracker))
+    dp.message.middleware(ActionLogMiddleware(user_tracker))
+    dp.callback_query.middleware(ActionLogMiddleware(user_tracker))
+    
     @dp.startup()
     async def on_startup():
         """Инициализация базы данных при запуске"""
         logger.info("Обработчики личных сообщений загружены")
     
-    @dp.message(Command('start'))
+    @dp.message(Command('start'), flags={'action': 'start_command', 'details': 'Пользователь начал чат'})
     async def start_command(message: types.Message):
         user = message.from_user
-        user_data = {
-            'id': user.id,
-            'username': user.username,
-            'first_name': user.first_name,
-            'last_name': user.last_name
-        }
-        
-        
-        await db.add_or_update_user(user_data)
-        
-        
-        await db.log_user_action(user.id, 'start_command', 'Пользователь начал чат')
         
         welcome_text = (
             f"👋 <b>Привет, {user.first_name}!</b>\n\n"
@@ -88,22 +112,10 @@ def setup_private_handlers(dp: Dispatcher, admin_ids: list):
         
         logger.info(f'Пользователь {user.id} начал чат')
 
-    @dp.message(F.text == "📊 Статистика")
+    @dp.message(F.text == "📊 Статистика", flags={'action': 'stats_button_click'})
     async def stats_button(message: types.Message):
         user_id = message.from_user.id
         
-        
-        user_data = {
-            'id': user_id,
-            'username': message.from_user.username,
-            'first_name': message.from_user.first_name,
-            'last_name': message.from_user.last_name
-        }
-        await db.add_or_update_user(user_data)
-        
-        
-        await db.log_user_action(user_id, 'stats_button_click')
-        
         if user_id in admin_ids:
             try:
                 
@@ -139,21 +151,8 @@ def setup_private_handlers(dp: Dispatcher, admin_ids: list):
             )
             await message.answer(user_stats_text, parse_mode="HTML")
 
-    @dp.message(F.text == "📝 Обратная связь")
+    @dp.message(F.text == "📝 Обратная связь", flags={'action': 'feedback_button_click'})
     async def feedback_button(message: types.Message, state: FSMContext):
-        user_id = message.from_user.id
-        
-        
-        user_data = {
-            'id': user_id,
-            'username': message.from_user.username,
-            'first_name': message.from_user.first_name,
-            'last_name': message.from_user.last_name
-        }
-        await db.add_or_update_user(user_data)
-        
-        await db.log_user_action(user_id, 'feedback_button_click')
-        
         await message.answer(
             "📝 <b>Обратная связь</b>\n\n"
             "Напишите ваше предложение, пожелание или сообщите о проблеме:",
@@ -182,7 +181,7 @@ def setup_private_handlers(dp: Dispatcher, admin_ids: list):
         
         
         await db.add_feedback(user_id, feedback_text)
-        await db.log_user_action(user_id, 'feedback_sent', f"Длина: {len(feedback_text)}")
+        await user_tracker.log_action(user_id, 'feedback_sent', f"Длина: {len(feedback_text)}")
         
         
         for admin_id in admin_ids:
@@ -201,21 +200,8 @@ def setup_private_handlers(dp: Dispatcher, admin_ids: list):
         await state.clear()
 
     
-    @dp.message(Command('support'))
+    @dp.message(Command('support'), flags={'action': 'support_command'})
     async def support_command(message: types.Message, state: FSMContext):
-        user_id = message.from_user.id
-        
-       
-        user_data = {
-            'id': user_id,
-            'username': message.from_user.username,
-            'first_name': message.from_user.first_name,
-            'last_name': message.from_user.last_name
-        }
-        await db.add_or_update_user(user_data)
-        
-        await db.log_user_action(user_id, 'support_command')
-        
         await message.answer(
             "🆘 <b>Поддержка</b>\n\n"
             "Опишите вашу проблему или вопрос, и мы обязательно поможем:",
@@ -238,7 +224,7 @@ def setup_private_handlers(dp: Dispatcher, admin_ids: list):
         
         
         await db.add_feedback(user_id, f"SUPPORT: {support_text}")
-        await db.log_user_action(user_id, 'support_sent', f"Длина: {len(support_text)}")
+        await user_tracker.log_action(user_id, 'support_sent', f"Длина: {len(support_text)}")
         
         
         for admin_id in admin_ids:
@@ -261,62 +247,64 @@ def setup_private_handlers(dp: Dispatcher, admin_ids: list):
     async def show_users(message: types.Message):
         user_id = message.from_user.id
         
-        
-        user_data = {
-            'id': user_id,
-            'username': message.from_user.username,
-            'first_name': message.from_user.first_name,
-            'last_name': message.from_user.last_name
-        }
-        await db.add_or_update_user(user_data)
-        
         if user_id not in admin_ids:
             await message.answer("❌ Эта команда доступна только администраторам")
             return
         
         try:
-            users = await db.get_all_users()
+            # Лишняя запись показывает, есть ли следующая страница
+            users = await db.get_users_page(limit=USERS_PAGE_SIZE + 1)
             if not users:
                 await message.answer("📭 В базе данных пока нет пользователей")
                 return
             
-            users_text = "👥 <b>Список пользователей:</b>\n\n"
-            for i, user in enumerate(users[:10], 1):  
-                user_id, username, first_name, last_name, messages_count, first_seen, last_seen = user
-                name = f"{first_name or ''} {last_name or ''}".strip() or "Без имени"
-                username_str = f"(@{username})" if username else ""
-                
-                users_text += (
-                    f"{i}. {name} {username_str}\n"
-                    f"   ID: {user_id} | Сообщений: {messages_count}\n"
-                    f"   Первый визит: {first_seen.split()[0]}\n"
-                    f"   Последний: {last_seen.split()[0]}\n\n"
-                )
-            
-            if len(users) > 10:
-                users_text += f"<i>... и еще {len(users) - 10} пользователей</i>"
-            
-            await message.answer(users_text, parse_mode="HTML")
+            users_text, keyboard = await build_users_page(
+                users[:USERS_PAGE_SIZE], page=1,
+                has_prev=False, has_next=len(users) > USERS_PAGE_SIZE
+            )
+            await message.answer(users_text, parse_mode="HTML", reply_markup=keyboard)
             
         except Exception as e:
             logger.error(f"Ошибка получения списка пользователей: {e}")
             await message.answer("❌ Ошибка получения списка пользователей")
 
-    @dp.message(F.text == "❓ Помощь")
-    async def help_button(message: types.Message):
-        user_id = message.from_user.id
-        
-        
-        user_data = {
-            'id': user_id,
-            'username': message.from_user.username,
-            'first_name': message.from_user.first_name,
-            'last_name': message.from_user.last_name
-        }
-        await db.add_or_update_user(user_data)
-        
-        await db.log_user_action(user_id, 'help_button_click')
+    @dp.callback_query(F.data.startswith("users|"))
+    async def users_page_callback(callback: types.CallbackQuery):
+        if callback.from_user.id not in admin_ids:
+            await callback.answer("❌ Только для администраторов", show_alert=True)
+            return
         
+        try:
+            _, direction, page, last_seen, cursor_user_id = callback.data.split("|")
+            page = int(page)
+            cursor = (last_seen, int(cursor_user_id))
+            
+            if direction == "next":
+                users = await db.get_users_page(after=cursor, limit=USERS_PAGE_SIZE + 1)
+                has_prev, has_next = True, len(users) > USERS_PAGE_SIZE
+                users = users[:USERS_PAGE_SIZE]
+            else:
+                # При листании назад лишняя запись оказывается в начале страницы
+                users = await db.get_users_page(before=cursor, limit=USERS_PAGE_SIZE + 1)
+                has_prev, has_next = len(users) > USERS_PAGE_SIZE, True
+                users = users[-USERS_PAGE_SIZE:]
+            
+            if not users:
+                await callback.answer("Больше пользователей нет")
+                return
+            
+            users_text, keyboard = await build_users_page(
+                users, page=page, has_prev=has_prev, has_next=has_next
+            )
+            await callback.message.edit_text(users_text, parse_mode="HTML", reply_markup=keyboard)
+            await callback.answer()
+            
+        except Exception as e:
+            logger.error(f"Ошибка листания списка пользователей: {e}")
+            await callback.answer("❌ Ошибка получения списка пользователей", show_alert=True)
+
+    @dp.message(F.text == "❓ Помощь", flags={'action': 'help_button_click'})
+    async def help_button(message: types.Message):
         help_text = (
             "🤖 <b>Команды и возможности бота:</b>\n\n"
             "📊 <b>Статистика</b> - просмотр статистики\n"
@@ -337,21 +325,8 @@ def setup_private_handlers(dp: Dispatcher, admin_ids: list):
         )
         await message.answer(help_text, parse_mode="HTML")
 
-    @dp.message(F.text == "📢 Канал")
+    @dp.message(F.text == "📢 Канал", flags={'action': 'channel_info_click'})
     async def channel_info(message: types.Message):
-        user_id = message.from_user.id
-        
-        
-        user_data = {
-            'id': user_id,
-            'username': message.from_user.username,
-            'first_name': message.from_user.first_name,
-            'last_name': message.from_user.last_name
-        }
-        await db.add_or_update_user(user_data)
-        
-        await db.log_user_action(user_id, 'channel_info_click')
-        
         channel_info_text = (
             "📢 <b>Наш спортивный канал:</b>\n\n"
             "⚽ Самые свежие спортивные новости\n"
@@ -366,21 +341,8 @@ def setup_private_handlers(dp: Dispatcher, admin_ids: list):
             reply_markup=get_channel_inline_keyboard()
         )
 
-    @dp.message(F.text == "🎮 Игры")
+    @dp.message(F.text == "🎮 Игры", flags={'action': 'games_menu_click'})
     async def games_menu(message: types.Message):
-        user_id = message.from_user.id
-        
-        
-        user_data = {
-            'id': user_id,
-            'username': message.from_user.username,
-            'first_name': message.from_user.first_name,
-            'last_name': message.from_user.last_name
-        }
-        await db.add_or_update_user(user_data)
-        
-        await db.log_user_action(user_id, 'games_menu_click')
-        
         await message.answer(
             "🎮 <b>Игровая зона!</b>\n\n"
             "Выберите игру:\n"
@@ -392,21 +354,8 @@ def setup_private_handlers(dp: Dispatcher, admin_ids: list):
         )
 
     
-    @dp.message(F.text == "🎯 Угадай число")
+    @dp.message(F.text == "🎯 Угадай число", flags={'action': 'start_number_game'})
     async def start_number_game(message: types.Message, state: FSMContext):
-        user_id = message.from_user.id
-        
-        
-        user_data = {
-            'id': user_id,
-            'username': message.from_user.username,
-            'first_name': message.from_user.first_name,
-            'last_name': message.from_user.last_name
-        }
-        await db.add_or_update_user(user_data)
-        
-        await db.log_user_action(user_id, 'start_number_game')
-        
         import random
         secret_number = random.randint(1, 100)
         attempts = 0
@@ -436,12 +385,18 @@ def setup_private_handlers(dp: Dispatcher, admin_ids: list):
         if message.text == "🔙 Назад":
             await state.clear()
             await message.answer("Игра завершена!", reply_markup=get_main_keyboard())
-            await db.log_user_action(user_id, 'game_exited')
+            await user_tracker.log_action(user_id, 'game_exited')
             return
         
         try:
             guess = int(message.text)
             user_data = await state.get_data()
+            if 'secret_number' not in user_data:
+                # Данные игры потеряны (истекли или вытеснены) - выходим из игры
+                await state.clear()
+                await message.answer("⌛ Игра устарела, начни новую через '🎮 Игры'",
+                                     reply_markup=get_main_keyboard())
+                return
             secret_number = user_data['secret_number']
             attempts = user_data['attempts'] + 1
             max_attempts = user_data['max_attempts']
@@ -468,7 +423,7 @@ def setup_private_handlers(dp: Dispatcher, admin_ids: list):
                     parse_mode="HTML",
                     reply_markup=get_main_keyboard()
                 )
-                await db.log_user_action(user_id, 'game_won', f"Число: {secret_number}, Попыток: {attempts}")
+                await user_tracker.log_action(user_id, 'game_won', f"Число: {secret_number}, Попыток: {attempts}")
                 await state.clear()
                 return
             
@@ -482,27 +437,14 @@ def setup_private_handlers(dp: Dispatcher, admin_ids: list):
                     parse_mode="HTML",
                     reply_markup=get_main_keyboard()
                 )
-                await db.log_user_action(user_id, 'game_lost', f"Число: {secret_number}")
+                await user_tracker.log_action(user_id, 'game_lost', f"Число: {secret_number}")
                 await state.clear()
             
         except ValueError:
             await message.answer("❌ Пожалуйста, введи число от 1 до 100!")
 
-    @dp.message(F.text == "🎲 Случайное число")
+    @dp.message(F.text == "🎲 Случайное число", flags={'action': 'random_number_click'})
     async def random_number(message: types.Message):
-        user_id = message.from_user.id
-        
-        
-        user_data = {
-            'id': user_id,
-            'username': message.from_user.username,
-            'first_name': message.from_user.first_name,
-            'last_name': message.from_user.last_name
-        }
-        await db.add_or_update_user(user_data)
-        
-        await db.log_user_action(user_id, 'random_number_click')
-        
         import random
         number = random.randint(1, 1000)
         await message.answer(
@@ -512,21 +454,8 @@ def setup_private_handlers(dp: Dispatcher, admin_ids: list):
             parse_mode="HTML"
         )
 
-    @dp.message(F.text == "⚙️ Настройки")
+    @dp.message(F.text == "⚙️ Настройки", flags={'action': 'settings_button_click'})
     async def settings_button(message: types.Message):
-        user_id = message.from_user.id
-        
-        
-        user_data = {
-            'id': user_id,
-            'username': message.from_user.username,
-            'first_name': message.from_user.first_name,
-            'last_name': message.from_user.last_name
-        }
-        await db.add_or_update_user(user_data)
-        
-        await db.log_user_action(user_id, 'settings_button_click')
-        
         await message.answer(
             "⚙️ <b>Настройки</b>\n\n"
             "Выберите опцию для настройки:",
@@ -534,21 +463,8 @@ def setup_private_handlers(dp: Dispatcher, admin_ids: list):
             reply_markup=get_settings_keyboard()
         )
 
-    @dp.message(F.text == "🔔 Уведомления")
+    @dp.message(F.text == "🔔 Уведомления", flags={'action': 'notifications_settings_click'})
     async def notifications_settings(message: types.Message, state: FSMContext):
-        user_id = message.from_user.id
-        
-        
-        user_data = {
-            'id': user_id,
-            'username': message.from_user.username,
-            'first_name': message.from_user.first_name,
-            'last_name': message.from_user.last_name
-        }
-        await db.add_or_update_user(user_data)
-        
-        await db.log_user_action(user_id, 'notifications_settings_click')
-        
         await message.answer(
             "🔔 <b>Настройки уведомлений</b>\n\n"
             "Выберите статус уведомлений:",
@@ -557,21 +473,8 @@ def setup_private_handlers(dp: Dispatcher, admin_ids: list):
         )
         await state.set_state(SettingsState.waiting_for_notifications)
 
-    @dp.message(F.text == "🌐 Язык")
+    @dp.message(F.text == "🌐 Язык", flags={'action': 'language_settings_click'})
     async def language_settings(message: types.Message, state: FSMContext):
-        user_id = message.from_user.id
-        
-        
-        user_data = {
-            'id': user_id,
-            'username': message.from_user.username,
-            'first_name': message.from_user.first_name,
-            'last_name': message.from_user.last_name
-        }
-        await db.add_or_update_user(user_data)
-        
-        await db.log_user_action(user_id, 'language_settings_click')
-        
         await message.answer(
             "🌐 <b>Выбор языка</b>\n\n"
             "Выберите язык интерфейса:",
@@ -580,21 +483,8 @@ def setup_private_handlers(dp: Dispatcher, admin_ids: list):
         )
         await state.set_state(SettingsState.waiting_for_language)
 
-    @dp.message(F.text == "🔙 Назад")
+    @dp.message(F.text == "🔙 Назад", flags={'action': 'back_button_click'})
     async def back_button(message: types.Message, state: FSMContext):
-        user_id = message.from_user.id
-        
-        
-        user_data = {
-            'id': user_id,
-            'username': message.from_user.username,
-            'first_name': message.from_user.first_name,
-            'last_name': message.from_user.last_name
-        }
-        await db.add_or_update_user(user_data)
-        
-        await db.log_user_action(user_id, 'back_button_click')
-        
         current_state = await state.get_state()
         if current_state:
             await state.clear()
@@ -607,21 +497,8 @@ def setup_private_handlers(dp: Dispatcher, admin_ids: list):
                 reply_markup=get_main_keyboard()
             )
 
-    @dp.message(Command('guess'))
+    @dp.message(Command('guess'), flags={'action': 'guess_command_used'})
     async def guess_command(message: types.Message):
-        user_id = message.from_user.id
-        
-        
-        user_data = {
-            'id': user_id,
-            'username': message.from_user.username,
-            'first_name': message.from_user.first_name,
-            'last_name': message.from_user.last_name
-        }
-        await db.add_or_update_user(user_data)
-        
-        await db.log_user_action(user_id, 'guess_command_used')
-        
         try:
             guess = int(message.text.split()[1])
             import random
@@ -648,17 +525,7 @@ def setup_private_handlers(dp: Dispatcher, admin_ids: list):
         user = message.from_user
         user_id = user.id
         
-        
-        user_data = {
-            'id': user_id,
-            'username': user.username,
-            'first_name': user.first_name,
-            'last_name': user.last_name
-        }
-        await db.add_or_update_user(user_data)
-        
-        
-        await db.log_user_action(user_id, 'message_sent', f"Тип: {message.content_type}")
+        await user_tracker.log_action(user_id, 'message_sent', f"Тип: {message.content_type}")
         
         
         await message.answer(
@@ -692,39 +559,60 @@ def setup_private_handlers(dp: Dispatcher, admin_ids: list):
             await message.answer("Рассылка отменена", reply_markup=get_main_keyboard())
             return
         
-        broadcast_text = message.text
-        users = await db.get_all_users()
+        if not message.text:
+            await message.answer("❌ Рассылка поддерживает только текст. Введите текст сообщения или нажмите «🔙 Назад»")
+            return
         
-        success_count = 0
-        fail_count = 0
+        if broadcaster.active:
+            await message.answer(
+                "⏳ Предыдущая рассылка еще выполняется, дождитесь ее завершения",
+                reply_markup=get_main_keyboard()
+            )
+            await state.clear()
+            return
         
-        await message.answer(f"🔄 Начинаю рассылку для {len(users)} пользователей...")
+        broadcast_text = message.text
+        total_users = await db.count_users()
         
-        for user in users:
-            try:
-                await bot.send_message(
-                    user[0],  # user_id
-                    f"📢 <b>Важное сообщение от администрации:</b>\n\n{broadcast_text}",
-                    parse_mode="HTML"
-                )
-                success_count += 1
-                await asyncio.sleep(0.1)  
-            except Exception as e:
-                fail_count += 1
-                logger.error(f"Ошибка отправки пользователю {user[0]}: {e}")
+        progress_message = await message.answer(f"🔄 Начинаю рассылку для {total_users} пользователей...")
+        job = await broadcaster.start(
+            bot, broadcast_text, user_id, progress_message.chat.id, progress_message.message_id
+        )
         
         await message.answer(
-            f"✅ Рассылка завершена!\n\n"
-            f"✅ Успешно: {success_count}\n"
-            f"❌ Не удалось: {fail_count}",
+            f"📢 Рассылка #{job['id']} запущена в фоне, прогресс обновляется в сообщении выше\n\n"
+            "/broadcast_status - состояние, /broadcast_cancel - отмена",
             reply_markup=get_main_keyboard()
         )
-        await db.log_user_action(user_id, 'broadcast_sent', f"Успешно: {success_count}, Ошибок: {fail_count}")
         await state.clear()
 
-    @dp.callback_query(F.data == "check_subscription")
+    @dp.message(Command('broadcast_status'))
+    async def broadcast_status_command(message: types.Message):
+        if message.from_user.id not in admin_ids:
+            await message.answer("❌ Эта команда доступна только администраторам")
+            return
+        
+        job = broadcaster.job if broadcaster.active else await db.get_broadcast_job()
+        if not job:
+            await message.answer("📭 Рассылок еще не было")
+            return
+        await message.answer(format_job_progress(job))
+
+    @dp.message(Command('broadcast_cancel'))
+    async def broadcast_cancel_command(message: types.Message):
+        if message.from_user.id not in admin_ids:
+            await message.answer("❌ Эта команда доступна только администраторам")
+            return
+        
+        job = await broadcaster.cancel()
+        if not job:
+            await message.answer("🤷 Активной рассылки нет")
+            return
+        await message.answer(format_job_progress(job))
+        await user_tracker.log_action(message.from_user.id, 'broadcast_cancelled', f"Рассылка #{job['id']}")
+
+    @dp.callback_query(F.data == "check_subscription", flags={'action': 'check_subscription_callback'})
     async def check_subscription_callback(callback: types.CallbackQuery, bot: Bot):
-        await db.log_user_action(callback.from_user.id, 'check_subscription_callback')
         
         try:
             user_id = callback.from_user.id
@@ -738,9 +626,8 @@ def setup_private_handlers(dp: Dispatcher, admin_ids: list):
         except Exception as e:
             await callback.answer("❌ Ошибка проверки подписки", show_alert=True)
 
-    @dp.callback_query(F.data.startswith("notifications_"))
+    @dp.callback_query(F.data.startswith("notifications_"), flags={'action': 'notifications_callback'})
     async def notifications_callback(callback: types.CallbackQuery):
-        await db.log_user_action(callback.from_user.id, 'notifications_callback')
         
         action = callback.data.split("_")[1]
         if action == "on":
@@ -748,9 +635,8 @@ def setup_private_handlers(dp: Dispatcher, admin_ids: list):
         else:
             await callback.answer("❌ Уведомления выключены!", show_alert=False)
 
-    @dp.callback_query(F.data.startswith("lang_"))
+    @dp.callback_query(F.data.startswith("lang_"), flags={'action': 'language_callback'})
     async def language_callback(callback: types.CallbackQuery):
-        await db.log_user_action(callback.from_user.id, 'language_callback')
         
         lang = callback.data.split("_")[1]
         languages = {"ru": "Русский", "en": "English", "es": "Español"}
@@ -762,49 +648,36 @@ def setup_private_handlers(dp: Dispatcher, admin_ids: list):
         """Команда для отладки базы данных"""
         user_id = message.from_user.id
         
-        
-        user_data = {
-            'id': user_id,
-            'username': message.from_user.username,
-            'first_name': message.from_user.first_name,
-            'last_name': message.from_user.last_name
-        }
-        await db.add_or_update_user(user_data)
-        
         if user_id not in admin_ids:
             await message.answer("❌ Эта команда доступна только администраторам")
             return
         
         try:
             
-            async with aiosqlite.connect('bot.db') as db_conn:
-                cursor = await db_conn.execute("PRAGMA table_info(user_stats)")
-                columns = await cursor.fetchall()
+            async with db.reader() as db_conn:
+                columns = await db_conn.execute_fetchall("PRAGMA table_info(user_stats)")
                 
                 debug_text = "📋 <b>Структура таблицы user_stats:</b>\n\n"
                 for col in columns:
                     debug_text += f"• {col[1]} ({col[2]})\n"
                 
                 
-                cursor = await db_conn.execute("SELECT * FROM user_stats LIMIT 5")
-                users = await cursor.fetchall()
+                users = await db_conn.execute_fetchall("SELECT * FROM user_stats LIMIT 5")
                 
                 debug_text += "\n👥 <b>Первые 5 пользователей:</b>\n\n"
                 for user in users:
                     debug_text += f"ID: {user[0]}, Сообщений: {user[4]}, Имя: {user[2] or 'Нет'}\n"
                 
                 
-                cursor = await db_conn.execute("SELECT COUNT(*) FROM user_stats")
-                total_users = (await cursor.fetchone())[0]
+                total_users = (await db_conn.execute_fetchall("SELECT COUNT(*) FROM user_stats"))[0][0]
                 
-                cursor = await db_conn.execute("SELECT SUM(messages_count) FROM user_stats")
-                total_messages = (await cursor.fetchone())[0] or 0
+                total_messages = (await db_conn.execute_fetchall("SELECT SUM(messages_count) FROM user_stats"))[0][0] or 0
                 
-                debug_text += f"\n📊 <b>Общая статистика:</b>\n"
-                debug_text += f"• Всего пользователей: {total_users}\n"
-                debug_text += f"• Всего сообщений: {total_messages}\n"
-                
-                await message.answer(debug_text, parse_mode="HTML")
+            debug_text += f"\n📊 <b>Общая статистика:</b>\n"
+            debug_text += f"• Всего пользователей: {total_users}\n"
+            debug_text += f"• Всего сообщений: {total_messages}\n"
+            
+            await message.answer(debug_text, parse_mode="HTML")
                 
         except Exception as e:
             await message.answer(f"❌ Ошибка отладки: {e}")
@@ -0,0 +1,128 @@
+import asyncio
+import html
+import time
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+from loguru import logger
+
+from database import db
+from ratelimit import TokenBucket, KeyedTokenBucket
+
+# Лимиты Bot API: около 30 сообщений в секунду всего и 20 в минуту в одну группу/канал
+GLOBAL_RATE = 25
+CHAT_RATE = 20 / 60
+# Сколько постов подряд можно отправить в канал без ожидания
+CHAT_BURST = 3
+# Если новостей пришло больше, вместо отдельных постов отправляется дайджест
+DIGEST_THRESHOLD = 5
+MAX_MESSAGE_LENGTH = 4096
+# Сколько раз подряд ждать RetryAfter, прежде чем отложить пост в очередь повторов
+MAX_RETRY_AFTER = 3
+# Очередь повторов: период проверки, базовая задержка (удваивается) и число попыток
+RETRY_CHECK_INTERVAL = 30
+RETRY_BASE_DELAY = 60
+MAX_ATTEMPTS = 6
+
+
+class Publisher:
+    """Публикация постов в каналы с ограничением скорости, дайджестами и очередью повторов"""
+
+    def __init__(self, global_rate=GLOBAL_RATE, chat_rate=CHAT_RATE, chat_burst=CHAT_BURST,
+                 digest_threshold=DIGEST_THRESHOLD):
+        self.global_limiter = TokenBucket(global_rate)
+        self.chat_limiter = KeyedTokenBucket(chat_rate, chat_burst)
+        self.digest_threshold = digest_threshold
+        self.sent = 0
+        self.digests = 0
+        self.queued = 0
+        self.dropped = 0
+
+    async def send(self, bot: Bot, chat_id, text: str):
+        """Отправка с учетом лимитов; на RetryAfter ждет ровно указанное Telegram время"""
+        for _ in range(MAX_RETRY_AFTER):
+            await self.global_limiter.acquire()
+            await self.chat_limiter.acquire(chat_id)
+            try:
+                await bot.send_message(
+                    chat_id=chat_id,
+                    text=text,
+                    parse_mode="HTML",
+                    disable_web_page_preview=False
+                )
+                self.sent += 1
+                return
+            except TelegramRetryAfter as e:
+                logger.warning(f"Публикация в {chat_id}: flood control, пауза {e.retry_after} сек.")
+                self.chat_limiter.pause(chat_id, e.retry_after)
+        raise RuntimeError(f"flood control не снят после {MAX_RETRY_AFTER} попыток")
+
+    async def publish(self, bot: Bot, chat_id, posts: list):
+        """Публикация пачки постов (dict с title, link, text); большая пачка - дайджестом"""
+        if len(posts) > self.digest_threshold:
+            texts = format_digest(posts)
+            self.digests += 1
+            logger.info(f"{len(posts)} новостей для {chat_id} объединены в дайджест")
+        else:
+            texts = [post['text'] for post in posts]
+        for text in texts:
+            await self._deliver(bot, chat_id, text)
+
+    async def _deliver(self, bot: Bot, chat_id, text: str):
+        try:
+            await self.send(bot, chat_id, text)
+        except (TelegramBadRequest, TelegramForbiddenError) as e:
+            # Повтор не поможет: неверная разметка или у бота нет прав в канале
+            self.dropped += 1
+            logger.error(f"Пост в {chat_id} отброшен: {e}")
+        except Exception as e:
+            self.queued += 1
+            logger.error(f"Ошибка отправки поста в {chat_id}, пост отложен: {e}")
+            await db.enqueue_post(chat_id, text, time.time() + RETRY_BASE_DELAY, last_error=str(e))
+
+    async def retry_loop(self, bot: Bot):
+        """Фоновая отправка постов из очереди повторов с экспоненциальной задержкой"""
+        while True:
+            await asyncio.sleep(RETRY_CHECK_INTERVAL)
+            try:
+                for post in await db.get_due_posts(time.time()):
+                    await self._retry(bot, post)
+            except Exception as e:
+                logger.error(f"Ошибка обработки очереди повторов: {e}")
+
+    async def _retry(self, bot: Bot, post: dict):
+        try:
+            await self.send(bot, post['chat_id'], post['text'])
+        except (TelegramBadRequest, TelegramForbiddenError) as e:
+            error = str(e)
+        except Exception as e:
+            attempts = post['attempts'] + 1
+            if attempts < MAX_ATTEMPTS:
+                delay = RETRY_BASE_DELAY * 2 ** post['attempts']
+                await db.reschedule_post(post['id'], attempts, time.time() + delay, str(e))
+                return
+            error = f"исчерпаны попытки: {e}"
+        else:
+            logger.success(f"Отложенный пост #{post['id']} отправлен в {post['chat_id']}")
+            await db.delete_post(post['id'])
+            return
+        self.dropped += 1
+        logger.error(f"Отложенный пост #{post['id']} в {post['chat_id']} отброшен: {error}")
+        await db.delete_post(post['id'])
+
+
+def format_digest(posts: list) -> list:
+    """Дайджест заголовков со ссылками, разбитый на сообщения не длиннее лимита Telegram"""
+    header = "📰 <b>Главные новости</b>\n"
+    messages = []
+    current = header
+    for post in posts:
+        line = f"\n• <a href='{html.escape(post['link'])}'>{html.escape(post['title'])}</a>"
+        if len(current) + len(line) > MAX_MESSAGE_LENGTH:
+            messages.append(current)
+            current = header
+        current += line
+    messages.append(current)
+    return messages
+
+
+publisher = Publisher()
@@ -0,0 +1,127 @@
+import asyncio
+import time
+from array import array
+from collections import OrderedDict
+
+
+class TokenBucket:
+    """Ограничитель скорости «ведро с токенами»: rate токенов в секунду, не больше capacity"""
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        """Ожидание свободного токена (ожидающие обслуживаются по очереди)"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        """Остановка выдачи токенов, например по RetryAfter от Telegram"""
+        now = time.monotonic()
+        self._paused_until = max(self._paused_until, now + seconds)
+        self._tokens = 0
+        self._updated = max(self._updated, self._paused_until)
+
+    @property
+    def idle(self) -> bool:
+        """Ведро полное - ограничитель можно забыть без потери точности"""
+        self._refill(max(time.monotonic(), self._updated))
+        return self._tokens >= self.capacity and not self._lock.locked()
+
+
+class KeyedTokenBucket:
+    """Отдельное ведро на каждый ключ (чат) с вытеснением давно не используемых"""
+
+    def __init__(self, rate: float, capacity: float = None, max_keys: int = 10000):
+        self.rate = rate
+        self.capacity = capacity
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+
+    def get(self, key) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self.rate, self.capacity)
+            if len(self._buckets) > self.max_keys:
+                self._evict()
+        else:
+            self._buckets.move_to_end(key)
+        return bucket
+
+    def _evict(self):
+        for key in list(self._buckets)[:len(self._buckets) - self.max_keys]:
+            if self._buckets[key].idle:
+                del self._buckets[key]
+
+    async def acquire(self, key):
+        await self.get(key).acquire()
+
+    def pause(self, key, seconds: float):
+        self.get(key).pause(seconds)
+
+
+class SlidingWindowCounter:
+    """Не больше limit событий за window секунд на пару (чат, пользователь).
+
+    Для каждой пары хранится кольцевой буфер из limit отметок времени:
+    превышение - если самая старая из них моложе окна. Затихшие пользователи
+    и чаты удаляются при периодической очистке
+    """
+
+    def __init__(self, limit: int, window: float, sweep_interval: float = 60):
+        self.limit = limit
+        self.window = window
+        self.sweep_interval = sweep_interval
+        # chat_id -> {user_id: [позиция, array отметок]}
+        self._chats = {}
+        self._next_sweep = time.monotonic() + sweep_interval
+
+    def hit(self, chat_id, user_id) -> bool:
+        """Учет события; True, если лимит превышен"""
+        now = time.monotonic()
+        if now >= self._next_sweep:
+            self.sweep(now)
+        users = self._chats.get(chat_id)
+        if users is None:
+            users = self._chats[chat_id] = {}
+        ring = users.get(user_id)
+        if ring is None:
+            ring = users[user_id] = [0, array('d', [float('-inf')] * self.limit)]
+        position, stamps = ring
+        oldest = stamps[position]
+        stamps[position] = now
+        ring[0] = (position + 1) % self.limit
+        return now - oldest < self.window
+
+    def sweep(self, now: float = None):
+        """Удаление пользователей без событий в окне и опустевших чатов"""
+        now = time.monotonic() if now is None else now
+        cutoff = now - self.window
+        for chat_id in list(self._chats):
+            users = self._chats[chat_id]
+            for user_id in [u for u, (position, stamps) in users.items() if stamps[position - 1] < cutoff]:
+                del users[user_id]
+            if not users:
+                del self._chats[chat_id]
+        self._next_sweep = now + self.sweep_interval
+
+    def __len__(self):
+        return sum(len(users) for users in self._chats.values())
@@ -0,0 +1,207 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import aiohttp
+import feedparser
+from loguru import logger
+
+from database import db
+
+FETCH_TIMEOUT = aiohttp.ClientTimeout(total=30, connect=10)
+MAX_FEED_SIZE = 10 * 1024 * 1024
+USER_AGENT = 'SportsBot/1.0 RSS reader'
+
+# Границы адаптивного интервала опроса ленты, сек.
+MIN_POLL_INTERVAL = 60
+MAX_POLL_INTERVAL = 3600
+# Сколько новых записей в среднем хотим получать за один опрос
+TARGET_ENTRIES_PER_POLL = 3
+MAX_CONCURRENT_FETCHES = 5
+
+
+class FeedTooLarge(Exception):
+    pass
+
+
+class FeedFetcher:
+    """Загрузка RSS через aiohttp и разбор в пуле потоков, не блокируя event loop"""
+
+    def __init__(self, parse_workers: int = 2):
+        self._session = None
+        self._executor = ThreadPoolExecutor(max_workers=parse_workers, thread_name_prefix='rss-parse')
+        # url -> (etag, last_modified) для условных запросов
+        self._validators = {}
+        self.not_modified = 0
+        self.downloaded = 0
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=FETCH_TIMEOUT,
+                headers={'User-Agent': USER_AGENT}
+            )
+        return self._session
+
+    async def _validators_for(self, url: str):
+        if url not in self._validators:
+            self._validators[url] = await db.get_feed_validators(url)
+        return self._validators[url]
+
+    async def _download(self, url: str):
+        """Условный GET: (тело, (etag, last_modified)); тело None, если лента не изменилась (304)"""
+        etag, last_modified = await self._validators_for(url)
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        
+        async with self._get_session().get(url, headers=headers) as response:
+            if response.status == 304:
+                return None, (etag, last_modified)
+            response.raise_for_status()
+            if response.content_length and response.content_length > MAX_FEED_SIZE:
+                raise FeedTooLarge(f"{url}: {response.content_length} байт")
+            body = bytearray()
+            async for chunk in response.content.iter_chunked(64 * 1024):
+                body.extend(chunk)
+                if len(body) > MAX_FEED_SIZE:
+                    raise FeedTooLarge(f"{url}: больше {MAX_FEED_SIZE} байт")
+            validators = (response.headers.get('ETag'), response.headers.get('Last-Modified'))
+        return bytes(body), validators
+
+    async def save_validators(self, url: str, validators):
+        """Запоминание ETag/Last-Modified после обработки записей ленты.
+
+        Раньше нельзя: при сбое обработки следующий опрос получил бы 304
+        и записи пропали бы до следующего изменения ленты
+        """
+        if validators is None or validators == await self._validators_for(url):
+            return
+        self._validators[url] = validators
+        await db.save_feed_validators(url, *validators)
+
+    async def parse(self, body: bytes):
+        """Разбор XML в отдельном потоке"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, feedparser.parse, body)
+
+    async def fetch(self, url: str):
+        """Загрузка и разбор ленты; при ответе 304 - пустая лента со status=304 без разбора.
+
+        В feed.validators - ETag/Last-Modified ответа, их сохраняет save_validators
+        """
+        body, validators = await self._download(url)
+        if body is None:
+            self.not_modified += 1
+            return feedparser.FeedParserDict(status=304, entries=[], bozo=False, validators=None)
+        self.downloaded += 1
+        feed = await self.parse(body)
+        feed['validators'] = validators
+        if feed.bozo and not feed.entries:
+            logger.warning(f"RSS {url}: ошибка разбора ленты: {feed.bozo_exception}")
+        return feed
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._executor.shutdown(wait=False)
+
+
+class FeedPoller:
+    """Параллельный опрос лент из реестра с подстройкой интервала под частоту публикаций.
+
+    handler(feed, entries) получает разобранные записи ленты и возвращает
+    количество новых среди них - по нему подбирается интервал опроса
+    """
+
+    def __init__(self, fetcher: FeedFetcher, max_concurrent: int = MAX_CONCURRENT_FETCHES):
+        self.fetcher = fetcher
+        self.handler = None
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._tasks = {}
+        self.intervals = {}
+
+    async def run(self, handler):
+        """Опрос всех включенных лент до отмены задачи"""
+        self.handler = handler
+        for feed in await db.get_feeds():
+            self.add(feed)
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await self.stop()
+
+    def add(self, feed: dict):
+        """Запуск опроса ленты (например, добавленной командой администратора)"""
+        if self.handler is None or feed['id'] in self._tasks:
+            return
+        self._tasks[feed['id']] = asyncio.create_task(
+            self._poll_loop(feed), name=f"FeedPoll-{feed['id']}"
+        )
+
+    def remove(self, feed_id: int):
+        task = self._tasks.pop(feed_id, None)
+        if task:
+            task.cancel()
+        self.intervals.pop(feed_id, None)
+
+    async def stop(self):
+        tasks = list(self._tasks.values())
+        self._tasks.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _poll_loop(self, feed: dict):
+        interval = feed['poll_interval']
+        errors = feed['error_count']
+        last_poll = None
+        while True:
+            error = None
+            new_entries = 0
+            async with self._semaphore:
+                started = time.monotonic()
+                try:
+                    parsed = await self.fetcher.fetch(feed['url'])
+                    if parsed.entries:
+                        new_entries = await self.handler(feed, parsed.entries)
+                    await self.fetcher.save_validators(feed['url'], parsed.validators)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    error = str(e) or type(e).__name__
+                    logger.error(f"RSS {feed['url']}: {error}")
+
+            if error:
+                errors += 1
+                # Экспоненциальная пауза для недоступной ленты; «здоровый» интервал не меняется
+                delay = min(MAX_POLL_INTERVAL, interval * 2 ** errors)
+            else:
+                errors = 0
+                elapsed = started - last_poll if last_poll else interval
+                interval = next_poll_interval(interval, new_entries, elapsed)
+                delay = interval
+            last_poll = started
+            self.intervals[feed['id']] = delay
+
+            try:
+                await db.update_feed_schedule(feed['id'], interval, errors, error)
+            except Exception as e:
+                logger.error(f"Не удалось сохранить расписание ленты {feed['url']}: {e}")
+            await asyncio.sleep(delay)
+
+
+def next_poll_interval(interval: float, new_entries: int, elapsed: float) -> float:
+    """Новый интервал опроса по наблюдаемой частоте публикаций"""
+    if new_entries == 0:
+        target = interval * 1.5
+    else:
+        # Интервал, за который в среднем выходит TARGET_ENTRIES_PER_POLL записей
+        target = (interval + elapsed * TARGET_ENTRIES_PER_POLL / new_entries) / 2
+    return max(MIN_POLL_INTERVAL, min(MAX_POLL_INTERVAL, target))
+
+
+fetcher = FeedFetcher()
+feed_poller = FeedPoller(fetcher)
@@ -0,0 +1,303 @@
+import asyncio
+import heapq
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+from urllib.parse import unquote, urlsplit
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StorageKey, StateType
+from dotenv import load_dotenv, find_dotenv
+from loguru import logger
+
+from database import db
+
+load_dotenv(find_dotenv())
+# memory - только один процесс; sqlite и redis позволяют запускать несколько
+STATE_BACKEND = os.getenv('STATE_BACKEND', 'memory')
+REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+# Сколько живет состояние диалога и брошенная игра без изменений
+STATE_TTL = 24 * 3600
+# Предел числа ключей в памяти: сверх него вытесняются давно не используемые
+STATE_MAX_KEYS = int(os.getenv('STATE_MAX_KEYS', '100000'))
+STATE_SWEEP_INTERVAL = 60
+
+
+class MemoryBackend:
+    """Состояние в памяти процесса.
+
+    Сроки жизни лежат в куче, поэтому очистка снимает только истекшие ключи
+    за O(log n) каждый; сверх max_keys вытесняются давно не используемые
+    """
+
+    def __init__(self, max_keys: int = STATE_MAX_KEYS):
+        self.max_keys = max_keys
+        # key -> (value, expires_at), порядок - от давно не используемых
+        self._items = OrderedDict()
+        # (expires_at, key); записи, устаревшие после продления, пропускаются
+        self._deadlines = []
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    async def get(self, key: str):
+        item = self._items.get(key)
+        if item is None:
+            return None
+        value, expires_at = item
+        if expires_at is not None and expires_at <= time.time():
+            del self._items[key]
+            return None
+        self._items.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value, ttl: float = None):
+        expires_at = time.time() + ttl if ttl else None
+        self._items[key] = (value, expires_at)
+        self._items.move_to_end(key)
+        if expires_at is not None:
+            heapq.heappush(self._deadlines, (expires_at, key))
+            if len(self._deadlines) > 2 * len(self._items) + 64:
+                self._rebuild_deadlines()
+        while len(self._items) > self.max_keys:
+            self._items.popitem(last=False)
+            self.evicted += 1
+
+    async def delete(self, key: str) -> bool:
+        return self._items.pop(key, None) is not None
+
+    async def purge_expired(self) -> int:
+        now = time.time()
+        purged = 0
+        while self._deadlines and self._deadlines[0][0] <= now:
+            expires_at, key = heapq.heappop(self._deadlines)
+            item = self._items.get(key)
+            if item is not None and item[1] == expires_at:
+                del self._items[key]
+                purged += 1
+        return purged
+
+    def _rebuild_deadlines(self):
+        """Сборка кучи заново без устаревших записей (после многих продлений)"""
+        self._deadlines = [(expires_at, key) for key, (_, expires_at) in self._items.items() if expires_at is not None]
+        heapq.heapify(self._deadlines)
+
+    async def close(self):
+        pass
+
+
+class SQLiteBackend:
+    """Состояние в таблице kv_state общей базы данных"""
+
+    async def get(self, key: str):
+        value = await db.get_state_value(key, time.time())
+        return None if value is None else json.loads(value)
+
+    async def set(self, key: str, value, ttl: float = None):
+        await db.set_state_value(key, json.dumps(value), time.time() + ttl if ttl else None)
+
+    async def delete(self, key: str) -> bool:
+        return await db.delete_state_value(key)
+
+    async def purge_expired(self) -> int:
+        return await db.purge_expired_state(time.time())
+
+    async def close(self):
+        pass
+
+
+class RedisError(Exception):
+    pass
+
+
+class RedisClient:
+    """Минимальный клиент протокола Redis (RESP2) на одном соединении"""
+
+    def __init__(self, url: str):
+        parts = urlsplit(url)
+        self.host = parts.hostname or 'localhost'
+        self.port = parts.port or 6379
+        self.password = unquote(parts.password) if parts.password else None
+        self.db_index = int(parts.path.lstrip('/') or 0)
+        self._reader = None
+        self._writer = None
+        self._lock = asyncio.Lock()
+
+    async def _connect(self):
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        if self.password:
+            await self._call('AUTH', self.password)
+        if self.db_index:
+            await self._call('SELECT', self.db_index)
+
+    async def _call(self, *args):
+        command = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode()
+            command.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        self._writer.write(b''.join(command))
+        await self._writer.drain()
+        return await self._read_reply()
+
+    async def _read_reply(self):
+        line = await self._reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise ConnectionError("Соединение с Redis закрыто")
+        prefix, payload = line[:1], line[1:-2]
+        if prefix == b'+':
+            return payload.decode()
+        if prefix == b'-':
+            raise RedisError(payload.decode())
+        if prefix == b':':
+            return int(payload)
+        if prefix == b'$':
+            length = int(payload)
+            if length < 0:
+                return None
+            return (await self._reader.readexactly(length + 2))[:-2]
+        if prefix == b'*':
+            length = int(payload)
+            if length < 0:
+                return None
+            return [await self._read_reply() for _ in range(length)]
+        raise RedisError(f"Неизвестный ответ Redis: {line!r}")
+
+    async def execute(self, *args):
+        """Выполнение команды; при обрыве соединения - одна попытка переподключиться"""
+        async with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._writer is None:
+                        await self._connect()
+                    return await self._call(*args)
+                except (ConnectionError, asyncio.IncompleteReadError, OSError):
+                    await self._disconnect()
+                    if attempt:
+                        raise
+                except RedisError:
+                    raise
+                except BaseException:
+                    # Отмена между отправкой команды и чтением ответа: непрочитанный
+                    # ответ достался бы следующей команде, соединение не переиспользуем
+                    self._abort()
+                    raise
+
+    async def _disconnect(self):
+        writer = self._writer
+        self._abort()
+        if writer is not None:
+            try:
+                await writer.wait_closed()
+            except Exception:
+                pass
+
+    def _abort(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+    async def close(self):
+        async with self._lock:
+            await self._disconnect()
+
+
+class RedisBackend:
+    """Состояние в Redis (или совместимом сервере); сроки жизни ключей ведет сервер"""
+
+    def __init__(self, url: str):
+        self.client = RedisClient(url)
+
+    async def get(self, key: str):
+        value = await self.client.execute('GET', key)
+        return None if value is None else json.loads(value)
+
+    async def set(self, key: str, value, ttl: float = None):
+        if ttl:
+            await self.client.execute('SET', key, json.dumps(value), 'PX', int(ttl * 1000))
+        else:
+            await self.client.execute('SET', key, json.dumps(value))
+
+    async def delete(self, key: str) -> bool:
+        return await self.client.execute('DEL', key) > 0
+
+    async def purge_expired(self) -> int:
+        return 0
+
+    async def close(self):
+        await self.client.close()
+
+
+async def run_sweeper(backend, interval: float = STATE_SWEEP_INTERVAL):
+    """Фоновая очистка истекших сессий"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            purged = await backend.purge_expired()
+            if purged:
+                logger.info(f"Удалено {purged} истекших сессий")
+        except Exception as e:
+            logger.error(f"Ошибка очистки сессий: {e}")
+
+
+def create_backend(name: str = STATE_BACKEND, redis_url: str = REDIS_URL):
+    """Хранилище состояния по имени: memory, sqlite или redis"""
+    if name == 'memory':
+        return MemoryBackend()
+    if name == 'sqlite':
+        return SQLiteBackend()
+    if name == 'redis':
+        return RedisBackend(redis_url)
+    raise ValueError(f"Неизвестный STATE_BACKEND: {name}")
+
+
+class BackendStorage(BaseStorage):
+    """FSM-хранилище aiogram поверх общего хранилища состояния"""
+
+    def __init__(self, backend, ttl: float = STATE_TTL):
+        self.backend = backend
+        self.ttl = ttl
+
+    @staticmethod
+    def _key(key: StorageKey) -> str:
+        return ':'.join(str(value) for value in (
+            'fsm', key.bot_id, key.chat_id, key.user_id, key.thread_id,
+            key.business_connection_id, key.destiny
+        ))
+
+    # Состояние и данные лежат под одним ключом {'state': ..., 'data': ...}:
+    # вытеснение и истечение срока снимают их только вместе
+
+    async def _get_record(self, key: StorageKey) -> Dict[str, Any]:
+        return await self.backend.get(self._key(key)) or {}
+
+    async def _set_record(self, key: StorageKey, record: Dict[str, Any]) -> None:
+        if record.get('state') is None and not record.get('data'):
+            await self.backend.delete(self._key(key))
+        else:
+            await self.backend.set(self._key(key), record, self.ttl)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        record = await self._get_record(key)
+        await self._set_record(key, {
+            'state': state.state if isinstance(state, State) else state,
+            'data': record.get('data') or {}
+        })
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._get_record(key)).get('state')
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        record = await self._get_record(key)
+        await self._set_record(key, {'state': record.get('state'), 'data': dict(data)})
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return dict((await self._get_record(key)).get('data') or {})
+
+    async def close(self) -> None:
+        await self.backend.close()
+
+
+state_backend = create_backend()
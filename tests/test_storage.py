@@ -0,0 +1,102 @@
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiogram.fsm.storage.base import StorageKey
+
+from storage import BackendStorage, RedisBackend, RedisClient
+
+
+class RespStandIn:
+    """Локальная замена Redis: GET/SET/DEL по протоколу RESP2, ответ можно задержать"""
+
+    def __init__(self, delay: float = 0):
+        self.delay = delay
+        self.data = {}
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._serve, '127.0.0.1', 0)
+        return f"redis://127.0.0.1:{self.server.sockets[0].getsockname()[1]}/0"
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def _read_command(self, reader):
+        line = await reader.readline()
+        if not line:
+            return None
+        args = []
+        for _ in range(int(line[1:-2])):
+            length = int((await reader.readline())[1:-2])
+            args.append((await reader.readexactly(length + 2))[:-2])
+        return args
+
+    async def _serve(self, reader, writer):
+        try:
+            while (args := await self._read_command(reader)) is not None:
+                command = args[0].upper()
+                if self.delay:
+                    await asyncio.sleep(self.delay)
+                if command == b'GET':
+                    value = self.data.get(args[1])
+                    reply = b"$-1\r\n" if value is None else b"$%d\r\n%s\r\n" % (len(value), value)
+                elif command == b'SET':
+                    self.data[args[1]] = args[2]
+                    reply = b"+OK\r\n"
+                elif command == b'DEL':
+                    reply = b":%d\r\n" % (self.data.pop(args[1], None) is not None)
+                else:
+                    reply = b"-ERR unknown command\r\n"
+                writer.write(reply)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+def test_redis_backend_fsm_roundtrip():
+    async def scenario():
+        stand_in = RespStandIn()
+        storage = BackendStorage(RedisBackend(await stand_in.start()))
+        key = StorageKey(bot_id=1, chat_id=2, user_id=3)
+        try:
+            await storage.set_state(key, 'GameState:playing_number_game')
+            await storage.set_data(key, {'secret_number': 42})
+            assert await storage.get_state(key) == 'GameState:playing_number_game'
+            assert await storage.get_data(key) == {'secret_number': 42}
+            await storage.set_state(key, None)
+            await storage.set_data(key, {})
+            assert await storage.get_state(key) is None
+            assert stand_in.data == {}
+        finally:
+            await storage.close()
+            await stand_in.stop()
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_command_does_not_leak_reply():
+    async def scenario():
+        stand_in = RespStandIn()
+        client = RedisClient(await stand_in.start())
+        try:
+            await client.execute('SET', 'first', 'one')
+            await client.execute('SET', 'second', 'two')
+            stand_in.delay = 0.05
+            task = asyncio.create_task(client.execute('GET', 'first'))
+            await asyncio.sleep(0.01)
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            stand_in.delay = 0
+            # Ответ на отмененный GET first не должен достаться следующей команде
+            assert await client.execute('GET', 'second') == b'two'
+        finally:
+            await client.close()
+            await stand_in.stop()
+
+    asyncio.run(scenario())